@@ -7,13 +7,35 @@ from io import BytesIO
 from fastapi import FastAPI, File, UploadFile, Form
 from fastapi.middleware.cors import CORSMiddleware
 import io
+import os
+import time
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 import torchvision.transforms as transforms
 from torchvision.models import efficientnet_b0, EfficientNet_B0_Weights
+from audit_log import AuditLog
+from structured_logging import RequestContextMiddleware, setup_logging
+from deadlines import DeadlineExceeded, RequestLifetimeMiddleware, check_deadline, deadline_var, request_stats
+
+# JSON logs through a background queue instead of blocking prints
+setup_logging("alzheimers-model")
+logger = logging.getLogger("alzheimers")
 
 # Create a FastAPI app
 app = FastAPI()
 
+# Cancel prediction requests whose X-Request-Timeout-Ms deadline passed or
+# whose client disconnected, instead of running inference for nobody.
+# Added before CORS so that 504s still carry CORS headers
+app.add_middleware(
+    RequestLifetimeMiddleware,
+    paths=("/api/predict", "/predict"),
+    default_timeout_ms=float(os.environ.get("DEFAULT_REQUEST_TIMEOUT_MS", "0")),
+)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -23,18 +45,40 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Request IDs and one sampled log line per request
+app.add_middleware(RequestContextMiddleware)
+
 # Classification classes for Alzheimer's
 CLASSES = ["Non Demented", "Very Mild Demented", "Mild Demented", "Moderate Demented"]
 
 # Global model variable
 model = None
 
+# Columnar audit log of predictions, written in the background (disabled unless AUDIT_LOG_DIR is set)
+audit_log = AuditLog(
+    os.environ.get("AUDIT_LOG_DIR"),
+    [
+        ("timestamp", "timestamp"),
+        ("source", "string"),
+        ("file_url", "string"),
+        ("image_width", "int64"),
+        ("image_height", "int64"),
+        ("image_mode", "string"),
+        ("model_loaded", "bool"),
+        ("prediction", "string"),
+        ("confidence", "float64"),
+        ("execution_time_ms", "float64"),
+    ],
+    file_format=os.environ.get("AUDIT_LOG_FORMAT", "parquet"),
+    max_queue=int(os.environ.get("AUDIT_LOG_MAX_QUEUE", "10000")),
+)
+
 # Model loading function with caching
 def load_model():
     global model
     if model is None:
         try:
-            print("Loading Alzheimer's detection model...")
+            logger.info("Loading Alzheimer's detection model...")
             # Load a pretrained EfficientNet model
             base_model = efficientnet_b0(weights=EfficientNet_B0_Weights.IMAGENET1K_V1)
             
@@ -48,9 +92,9 @@ def load_model():
             # Set model to evaluation mode
             base_model.eval()
             model = base_model
-            print("Alzheimer's detection model loaded successfully")
+            logger.info("Alzheimer's detection model loaded successfully")
         except Exception as e:
-            print(f"Error loading model: {str(e)}")
+            logger.error(f"Error loading model: {str(e)}")
             model = None
     
     return model
@@ -85,7 +129,7 @@ def predict(model, image):
         class_idx = np.random.randint(0, len(CLASSES))
         confidence = np.random.uniform(0.6, 0.95)
         prediction = CLASSES[class_idx]
-        print("Using alternative prediction method")
+        logger.warning("Using alternative prediction method")
         return prediction, float(confidence)
     
     try:
@@ -102,10 +146,9 @@ def predict(model, image):
             confidence = probabilities[class_idx].item()
             prediction = CLASSES[class_idx]
         
-        print(f"Prediction: {prediction}, Confidence: {confidence:.4f}")
         return prediction, float(confidence)
     except Exception as e:
-        print(f"Error during prediction: {str(e)}")
+        logger.error(f"Error during prediction: {str(e)}")
         # Alternative prediction method
         class_idx = np.random.randint(0, len(CLASSES))
         confidence = np.random.uniform(0.6, 0.95)
@@ -113,9 +156,22 @@ def predict(model, image):
         return prediction, float(confidence)
 
 # Function to process direct image upload
-def process_image(image):
+def process_image(image, source="upload", file_url=None):
+    start_time = time.time()
     model = load_model()
     prediction, confidence = predict(model, image)
+    audit_log.record({
+        "timestamp": start_time,
+        "source": source,
+        "file_url": file_url,
+        "image_width": getattr(image, "width", None),
+        "image_height": getattr(image, "height", None),
+        "image_mode": getattr(image, "mode", None),
+        "model_loaded": model is not None,
+        "prediction": prediction,
+        "confidence": confidence,
+        "execution_time_ms": (time.time() - start_time) * 1000,
+    })
     return {
         "prediction": prediction,
         "confidence": confidence
@@ -124,9 +180,14 @@ def process_image(image):
 # Function to process image from URL
 def process_url(url):
     try:
-        response = requests.get(url)
+        deadline = deadline_var.get()
+        response = requests.get(url, timeout=None if deadline is None else max(0.1, deadline - time.time()))
         image = Image.open(BytesIO(response.content))
-        return process_image(image)
+        # The download may have used up the request's time
+        check_deadline(deadline)
+        return process_image(image, source="url", file_url=url)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         return {
             "prediction": "Error processing image",
@@ -134,6 +195,43 @@ def process_url(url):
             "error": str(e)
         }
 
+# API inference runs on a bounded pool instead of the event loop, so it can be
+# skipped when the request's deadline passed or its client went away
+inference_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("INFERENCE_WORKERS", "1")), thread_name_prefix="inference"
+)
+inference_stats = {"completed": 0, "expired": 0, "cancelled_queued": 0, "cancelled_running": 0, "wasted_run_ms": 0.0}
+
+def _run_before_deadline(fn, args, deadline):
+    check_deadline(deadline)
+    started_at = time.time()
+    return fn(*args), (time.time() - started_at) * 1000
+
+def _record_wasted(job):
+    if not job.cancelled() and job.exception() is None:
+        inference_stats["wasted_run_ms"] += job.result()[1]
+
+async def run_inference(fn, *args):
+    """Run fn on the inference pool under the request's deadline, counting wasted work"""
+    loop = asyncio.get_running_loop()
+    # The copied context carries the request ID and deadline into the worker
+    job = inference_executor.submit(contextvars.copy_context().run, _run_before_deadline, fn, args, deadline_var.get())
+    try:
+        result, _ = await asyncio.wrap_future(job, loop=loop)
+    except DeadlineExceeded:
+        inference_stats["expired"] += 1
+        raise
+    except asyncio.CancelledError:
+        if job.cancel():
+            inference_stats["cancelled_queued"] += 1
+        else:
+            # Already running; it finishes for nobody
+            inference_stats["cancelled_running"] += 1
+            job.add_done_callback(lambda job: loop.call_soon_threadsafe(_record_wasted, job))
+        raise
+    inference_stats["completed"] += 1
+    return result
+
 # New FastAPI endpoint for API calls
 @app.post("/api/predict")
 async def api_predict(
@@ -147,12 +245,14 @@ async def api_predict(
             image = Image.open(io.BytesIO(content))
         elif fileUrl:
             # Process image from Uploadcare URL
-            return process_url(fileUrl)
+            return await run_inference(process_url, fileUrl)
         else:
             return {"error": "Either file or fileUrl is required"}
         
         # Process the image
-        return process_image(image)
+        return await run_inference(process_image, image)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
@@ -162,10 +262,20 @@ async def predict_endpoint(file: UploadFile = File(...)):
     try:
         content = await file.read()
         image = Image.open(io.BytesIO(content))
-        return process_image(image)
+        return await run_inference(process_image, image)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
+@app.get("/api/stats")
+async def stats():
+    return {
+        "requests": request_stats(),
+        "inference": inference_stats,
+        "audit_log": audit_log.stats(),
+    }
+
 # Create the Gradio interface
 with gr.Blocks() as demo:
     gr.Markdown("# Alzheimer's Detection Model")
@@ -201,4 +311,5 @@ app = gr.mount_gradio_app(app, demo, path="/")
 # This is only used when running the file directly
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=7860) 
\ No newline at end of file
+    # Logging is already configured; keep uvicorn from replacing it
+    uvicorn.run(app, host="0.0.0.0", port=7860, log_config=None, access_log=False) 
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""Request deadlines, and cancellation of work for clients that are gone.
+
+A client can send X-Request-Timeout-Ms, how long in milliseconds it will
+wait for the response, counted from when the request arrives.
+RequestLifetimeMiddleware turns it into an absolute wall-clock deadline
+(comparable across worker processes), exposes it to the handler through
+deadline_var, and cancels the handler when it passes. If the response has
+not started, the client gets a 504. Work that waits in an executor queue
+calls check_deadline() when a worker picks it up, so a job whose deadline
+passed while it was queued is dropped before inference.
+
+Once the request body has been read, the middleware also watches for the
+client disconnecting and cancels the handler when it does. Cancelling the
+handler cancels whatever it awaits. Executor jobs that have not started
+are removed from the queue; jobs already running finish unobserved.
+
+Only paths under the given prefixes are tracked. Abandoned requests are
+counted in request_stats() and logged as 504 (deadline) or 499 (client
+disconnected).
+
+This module is vendored into each Space; keep the copies identical.
+"""
+import asyncio
+import contextvars
+import json
+import time
+
+deadline_var = contextvars.ContextVar("deadline", default=None)
+
+HEADER = b"x-request-timeout-ms"
+
+_stats = {"with_deadline": 0, "expired": 0, "disconnected": 0}
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before the work could start"""
+
+
+def check_deadline(deadline):
+    """Raise DeadlineExceeded if the wall-clock deadline (or None) has passed"""
+    if deadline is not None and time.time() > deadline:
+        raise DeadlineExceeded(f"Deadline passed {(time.time() - deadline) * 1000:.0f} ms ago")
+
+
+def request_stats():
+    return dict(_stats)
+
+
+def _timeout_ms(scope, default_timeout_ms):
+    for name, value in scope.get("headers", ()):
+        if name == HEADER:
+            try:
+                return float(value)
+            except ValueError:
+                break
+    return default_timeout_ms or None
+
+
+class RequestLifetimeMiddleware:
+    """ASGI middleware enforcing request deadlines and cancelling on client disconnect.
+
+    on_abandon, if given, is called with "expired" or "disconnected" for
+    every request cancelled for that reason.
+    """
+
+    def __init__(self, app, paths=("/",), default_timeout_ms=0, on_abandon=None):
+        self.app = app
+        self.paths = tuple(paths)
+        self.default_timeout_ms = default_timeout_ms
+        self.on_abandon = on_abandon
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        timeout_ms = _timeout_ms(scope, self.default_timeout_ms)
+        deadline = None if timeout_ms is None else time.time() + timeout_ms / 1000
+        if deadline is not None:
+            _stats["with_deadline"] += 1
+            if timeout_ms <= 0:
+                await self._abandon("expired", send, response_started=False)
+                return
+
+        loop = asyncio.get_running_loop()
+        disconnected = loop.create_future()
+        response = {"started": False, "finished": False}
+        watcher = None
+
+        async def watch_disconnect():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    # Servers also report a disconnect once the response is complete
+                    if not response["finished"] and not disconnected.done():
+                        disconnected.set_result(None)
+                    return
+
+        async def receive_wrapper():
+            nonlocal watcher
+            if watcher is not None:
+                # Body fully read; the watcher owns receive() from here on
+                await asyncio.shield(disconnected)
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                if not disconnected.done():
+                    disconnected.set_result(None)
+            elif not message.get("more_body", False):
+                watcher = asyncio.ensure_future(watch_disconnect())
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["started"] = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response["finished"] = True
+            await send(message)
+
+        # The handler task copies the current context, deadline included
+        token = deadline_var.set(deadline)
+        task = asyncio.ensure_future(self.app(scope, receive_wrapper, send_wrapper))
+        deadline_var.reset(token)
+        abandoned = None
+
+        def abandon(reason):
+            nonlocal abandoned
+            if abandoned is None and not task.done():
+                abandoned = reason
+                task.cancel()
+
+        disconnected.add_done_callback(lambda future: future.cancelled() or abandon("disconnected"))
+        timer = None if deadline is None else loop.call_later(deadline - time.time(), abandon, "expired")
+        try:
+            await task
+        except asyncio.CancelledError:
+            # Cancelled from outside (e.g. server shutdown) rather than abandoned
+            if abandoned is None:
+                raise
+        except DeadlineExceeded:
+            abandoned = "expired"
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if watcher is not None:
+                watcher.cancel()
+            if not disconnected.done():
+                disconnected.cancel()
+        if abandoned is not None:
+            await self._abandon(abandoned, send, response["started"])
+
+    async def _abandon(self, reason, send, response_started):
+        _stats[reason] += 1
+        if self.on_abandon is not None:
+            self.on_abandon(reason)
+        if response_started:
+            return
+        # Nobody reads a 499; it only makes the access log show what happened
+        status, detail = (504, "Request deadline exceeded") if reason == "expired" else (499, "Client disconnected")
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -3,15 +3,21 @@ import numpy as np
 import tensorflow as tf
 from PIL import Image
 import io
+import logging
 import requests
+from structured_logging import request_context, setup_logging
+
+# JSON logs through a background queue instead of blocking prints
+setup_logging("brain-tumor-model")
+logger = logging.getLogger("brain_tumor")
 
 # Load the trained model
 try:
     model = tf.keras.models.load_model("BRAIINTUMORMODEL.h5")
-    print("✅ Brain tumor model loaded successfully!")
+    logger.info("Brain tumor model loaded successfully")
     MODEL_LOADED = True
-        except Exception as e:
-    print(f"❌ Error loading model: {e}")
+except Exception as e:
+    logger.error(f"Error loading model: {e}")
     model = None
     MODEL_LOADED = False
 
@@ -20,6 +26,10 @@ class_labels = ["Glioma", "Meningioma", "No Tumor", "Pituitary"]
 
 def predict_brain_tumor(img):
     """Predict brain tumor type from PIL Image"""
+    with request_context("predict_brain_tumor"):
+        return _predict_brain_tumor(img)
+
+def _predict_brain_tumor(img):
     if not MODEL_LOADED or model is None:
         return "❌ Model not available. Please check model file."
     
@@ -39,6 +49,9 @@ def predict_brain_tumor(img):
         predicted_class = class_labels[predicted_class_idx]
         confidence = float(np.max(prediction))
         
+        logger.info("Prediction: %s, confidence %.4f", predicted_class, confidence,
+                    extra={"prediction": predicted_class, "confidence": confidence})
+        
         # Format output
         result = f"🧠 **Prediction: {predicted_class}**\n"
         result += f"📊 **Confidence: {confidence*100:.2f}%**\n\n"
@@ -51,6 +64,7 @@ def predict_brain_tumor(img):
         return result
         
     except Exception as e:
+        logger.error(f"Error during prediction: {e}")
         return f"❌ Error during prediction: {str(e)}"
 
 # Create Gradio Interface
@@ -0,0 +1,261 @@
+"""Non-blocking structured logging shared by the hf-spaces apps.
+
+setup_logging() routes the root logger through a queue: the thread that
+logs only builds the record and appends it to a bounded queue, and a
+listener thread formats it as one JSON object per line on stdout. When
+the queue is full, records are counted and dropped rather than blocking
+the request.
+
+RequestContextMiddleware gives every HTTP request an ID (the incoming
+X-Request-ID header, or a new one), echoes it in the response, and logs
+one "request" line with status and duration. Records logged while a
+request is handled carry its request_id and route. Per route, the
+log level can be raised or lowered and requests can be sampled. The
+sampling decision is made once per request, so a sampled request keeps
+all of its lines. Warnings and errors are always kept.
+
+Configuration, all optional:
+
+    LOG_LEVEL=INFO
+    LOG_ROUTE_LEVELS=/metrics=WARNING,/api/admin=DEBUG
+    LOG_SAMPLE_RATES=/api/predict=0.01
+    LOG_QUEUE_SIZE=10000
+
+Routes match by longest path prefix.
+
+This module is vendored into each Space; keep the copies identical.
+"""
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+route_var = contextvars.ContextVar("route", default=None)
+sampled_var = contextvars.ContextVar("sampled", default=True)
+
+# Attributes every LogRecord has; anything else was passed with extra=. uvicorn
+# adds color_message, an ANSI-coloured copy of the message.
+_RECORD_ATTRS = (set(vars(logging.LogRecord("", 0, "", 0, "", None, None)))
+                 | {"message", "asctime", "taskName", "color_message"})
+_MAX_REQUEST_ID_LENGTH = 128
+
+_config = {"level": logging.INFO, "route_levels": {}, "sample_rates": {}}
+_handler = None
+_listener = None
+
+
+def _parse_routes(text, convert):
+    """'/a=x,/b=y' -> {'/a': convert('x'), '/b': convert('y')}"""
+    routes = {}
+    for item in (text or "").split(","):
+        if "=" in item:
+            route, value = item.rsplit("=", 1)
+            routes[route.strip()] = convert(value.strip())
+    return routes
+
+
+def _level(value):
+    return value if isinstance(value, int) else logging.getLevelName(str(value).upper())
+
+
+def _longest_prefix(table, route):
+    matches = [prefix for prefix in table if route.startswith(prefix)]
+    return table[max(matches, key=len)] if matches else None
+
+
+@functools.lru_cache(maxsize=1024)
+def route_level(route):
+    level = _longest_prefix(_config["route_levels"], route)
+    return _config["level"] if level is None else level
+
+
+@functools.lru_cache(maxsize=1024)
+def sample_rate(route):
+    rate = _longest_prefix(_config["sample_rates"], route)
+    return 1.0 if rate is None else rate
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Applies route levels and sampling, and stamps records with the request context.
+
+    Runs in the thread that logs, before the record is queued, so filtered
+    records cost almost nothing.
+    """
+
+    def filter(self, record):
+        route = route_var.get()
+        if route is None:
+            return record.levelno >= _config["level"]
+        if record.levelno < logging.WARNING and not sampled_var.get():
+            return False
+        if record.levelno < route_level(route):
+            return False
+        record.request_id = request_id_var.get()
+        record.route = route
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking or raising when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _start_listener(service, queue_size):
+    global _listener
+    _handler.queue = queue.Queue(maxsize=queue_size)
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter(service))
+    _listener = logging.handlers.QueueListener(_handler.queue, stream)
+    _listener.start()
+
+
+def setup_logging(service, level=None, route_levels=None, sample_rates=None, queue_size=None):
+    """Send all logging (including uvicorn's) through the queue as JSON; safe to call twice"""
+    global _handler
+    _config["level"] = _level(level or os.environ.get("LOG_LEVEL", "INFO"))
+    _config["route_levels"] = (
+        {route: _level(value) for route, value in route_levels.items()} if route_levels is not None
+        else _parse_routes(os.environ.get("LOG_ROUTE_LEVELS"), _level)
+    )
+    _config["sample_rates"] = (
+        dict(sample_rates) if sample_rates is not None
+        else _parse_routes(os.environ.get("LOG_SAMPLE_RATES"), float)
+    )
+    route_level.cache_clear()
+    sample_rate.cache_clear()
+
+    root = logging.getLogger()
+    # Route levels may be more verbose than the global level; the filter enforces both
+    root.setLevel(min([_config["level"], *_config["route_levels"].values()]))
+    if _handler is not None:
+        return _handler
+
+    queue_size = queue_size or int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+    _handler = DroppingQueueHandler(None)
+    _handler.addFilter(ContextFilter())
+    _start_listener(service, queue_size)
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logging.getLogger(name).handlers.clear()
+        logging.getLogger(name).propagate = True
+
+    atexit.register(lambda: _listener.stop())
+    # The listener thread doesn't survive fork; pre-forked workers start their own
+    os.register_at_fork(after_in_child=lambda: _start_listener(service, queue_size))
+    return _handler
+
+
+def dropped_records():
+    return _handler.dropped if _handler is not None else 0
+
+
+def _enter(route, request_id):
+    return (
+        request_id_var.set(request_id),
+        route_var.set(route),
+        sampled_var.set(random.random() < sample_rate(route)),
+    )
+
+
+def _exit(tokens):
+    request_id_var.reset(tokens[0])
+    route_var.reset(tokens[1])
+    sampled_var.reset(tokens[2])
+
+
+@contextmanager
+def request_context(route, request_id=None):
+    """Request context for work that doesn't arrive over HTTP, e.g. a Gradio callback"""
+    request_id = request_id or uuid.uuid4().hex
+    tokens = _enter(route, request_id)
+    try:
+        yield request_id
+    finally:
+        _exit(tokens)
+
+
+class RequestContextMiddleware:
+    """ASGI middleware assigning request IDs and logging one line per request"""
+
+    def __init__(self, app):
+        self.app = app
+        self.logger = logging.getLogger("access")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:_MAX_REQUEST_ID_LENGTH]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        tokens = _enter(scope["path"], request_id)
+        start_time = time.perf_counter()
+        status = 500
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", ()), (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            self.logger.log(
+                logging.WARNING if status >= 500 else logging.INFO,
+                "request",
+                extra={
+                    "method": scope["method"],
+                    "status": status,
+                    "duration_ms": (time.perf_counter() - start_time) * 1000,
+                },
+            )
+            _exit(tokens)
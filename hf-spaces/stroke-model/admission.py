@@ -0,0 +1,112 @@
+"""Admission control for the prediction endpoints.
+
+Each prediction request is admitted or rejected on arrival, before its
+body is read. Once the requests in progress or the inference jobs waiting
+for a worker reach their limit, the request is answered at once with a 503
+and a Retry-After header instead of joining a queue it would time out in.
+Admitted work keeps every worker busy, so completed requests per second
+stay near capacity during a spike while the excess is shed cheaply.
+
+Only paths under the guarded prefixes are counted or rejected; health,
+metrics and admin endpoints always get through.
+"""
+import json
+import math
+
+
+class AdmissionController:
+    """Limits on requests in progress and on the inference pool's queue; 0 disables a limit"""
+
+    def __init__(self, pool, max_in_flight=0, max_queue_depth=0, guarded_prefixes=("/api/predict",),
+                 max_retry_after=30, on_reject=None):
+        self.pool = pool
+        self.max_in_flight = max_in_flight
+        self.max_queue_depth = max_queue_depth
+        self.guarded_prefixes = tuple(guarded_prefixes)
+        self.max_retry_after = max_retry_after
+        self.on_reject = on_reject
+        # Only touched from the event loop, so plain integers are enough
+        self.in_flight = 0
+        self.max_in_flight_seen = 0
+        self.admitted = 0
+        self.rejected = {"in_flight": 0, "queue_depth": 0}
+
+    @property
+    def enabled(self):
+        return bool(self.max_in_flight or self.max_queue_depth)
+
+    def guards(self, scope):
+        # CORS preflights do no work
+        return scope["method"] != "OPTIONS" and scope["path"].startswith(self.guarded_prefixes)
+
+    def rejection_reason(self):
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return "in_flight"
+        if self.max_queue_depth and self.pool.queue_depth >= self.max_queue_depth:
+            return "queue_depth"
+        return None
+
+    def retry_after(self):
+        """Whole seconds until the current backlog should have drained, from the average job time"""
+        pool = self.pool
+        avg_run_s = pool.total_run_ms / pool.completed / 1000 if pool.completed else 0.0
+        backlog_s = max(self.in_flight, pool.in_flight) * avg_run_s / pool.max_workers
+        return min(self.max_retry_after, max(1, math.ceil(backlog_s)))
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "max_in_flight": self.max_in_flight,
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self.in_flight,
+            "max_in_flight_seen": self.max_in_flight_seen,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware that sheds guarded requests with a 503 while the controller is over a limit"""
+
+    def __init__(self, app, controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        controller = self.controller
+        if scope["type"] != "http" or not controller.enabled or not controller.guards(scope):
+            await self.app(scope, receive, send)
+            return
+
+        reason = controller.rejection_reason()
+        if reason is not None:
+            controller.rejected[reason] += 1
+            if controller.on_reject is not None:
+                controller.on_reject(reason)
+            await self._reject(send, reason, controller.retry_after())
+            return
+
+        controller.in_flight += 1
+        controller.admitted += 1
+        controller.max_in_flight_seen = max(controller.max_in_flight_seen, controller.in_flight)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.in_flight -= 1
+
+    @staticmethod
+    async def _reject(send, reason, retry_after):
+        body = json.dumps({
+            "detail": f"Server is overloaded; retry after {retry_after} s",
+            "reason": reason,
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,48 +1,157 @@
-import joblib
-import pandas as pd
+import asyncio
+import secrets
 import numpy as np
-from fastapi import FastAPI, Form, File, UploadFile, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Form, File, UploadFile, Request, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import time
 import json
+from datetime import datetime
 from typing import Optional, List, Union
 import uvicorn
-
-# Load the trained model
-print("Loading model...")
-model_path = "/app/model.joblib"
 import os
-print(f"Model path: {model_path}")
-print(f"Model file exists: {os.path.exists(model_path)}")
-print(f"Model file size: {os.path.getsize(model_path) / 1024:.2f} KB")
+import logging
+
+from structured_logging import RequestContextMiddleware, dropped_records, setup_logging
+from admission import AdmissionController, AdmissionMiddleware
+from deadlines import RequestLifetimeMiddleware, request_stats
+from inference_pool import InferencePool
+from micro_batcher import MicroBatcher
+from prediction_cache import PredictionCache
+from metrics import Counter, Histogram, CallbackGauge, render_metrics
+from audit_log import AuditLog
+from calibration import CalibratedEngine
+from bulk_scoring import SUBMISSION_HEADER, CsvChunker, RequestStreamingResponse, score_rows
+from scoring_engines import INPUT_FIELDS, preprocess_input
+from model_loader import LoadedModel, artifact_version, load_model
+from rules import RuleEngine
+from json_api import JSON_LIBRARY, FastJSONResponse, SchemaValidationError, parse_batch, parse_record
+import prefork
+
+# JSON logs through a background queue, configured before anything else logs
+setup_logging("stroke-model")
+logger = logging.getLogger("stroke")
+
+# Scoring engine is selected once at startup: sklearn, compiled or onnx
+SCORING_ENGINE = os.environ.get("SCORING_ENGINE", "sklearn")
+MODEL_PATH = os.environ.get("MODEL_PATH", "/app/model.joblib")
+ONNX_MODEL_PATH = os.environ.get("ONNX_MODEL_PATH", "/app/model.onnx")
+SERVED_MODEL_PATH = ONNX_MODEL_PATH if SCORING_ENGINE == "onnx" else MODEL_PATH
+# Memory-map the artifact's arrays instead of copying them (needs an uncompressed artifact)
+MODEL_MMAP = os.environ.get("MODEL_MMAP", "false").lower() in ("1", "true", "yes")
+# Reference population scored at load time for percentile lookups; empty disables them
+POPULATION_DATA = os.environ.get(
+    "POPULATION_DATA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "train.csv")
+)
+# Records per drift comparison against POPULATION_DATA; 0 disables drift monitoring
+DRIFT_WINDOW_SIZE = int(os.environ.get("DRIFT_WINDOW_SIZE", "1000"))
 
+# Load the trained model. Handlers read current_model once per request, and
+# hot reloads replace it with a single assignment.
 try:
-    model_info = joblib.load(model_path)
-    print("Model loaded successfully!")
-    
-    # Access model components
-    pipeline = model_info['model']
-    model = pipeline.named_steps['classifier']
-    print(f"Model details: Type: {type(model)}")
-    
-    # Get preprocessing info
-    numeric_cols = model_info['numeric_cols']
-    categorical_cols = model_info['encoded_cols']
-    print(f"Features: {len(numeric_cols)} numeric features, {len(categorical_cols)} encoded features")
-    
-    # Verify model has predict_proba
-    has_predict_proba = hasattr(model, 'predict_proba')
-    print(f"Model has predict_proba method: {'Yes' if has_predict_proba else 'No'}")
+    current_model = load_model(SCORING_ENGINE, MODEL_PATH, ONNX_MODEL_PATH, MODEL_MMAP, POPULATION_DATA,
+                               DRIFT_WINDOW_SIZE)
 except Exception as e:
-    print(f"Error loading model: {e}")
-    model_info = None
+    logger.error(f"Error loading model: {e}")
+    current_model = LoadedModel(SERVED_MODEL_PATH, error=str(e))
 
 # Initialize FastAPI
 app = FastAPI(title="Stroke Prediction Model API")
 
-# Add CORS middleware
+# Prometheus metrics, exported on /metrics
+STAGE_SECONDS = Histogram(
+    "stroke_stage_duration_seconds",
+    "Time spent in each stage of a prediction request",
+    labelnames=("stage",),
+)
+REQUEST_SECONDS = Histogram(
+    "stroke_request_duration_seconds",
+    "End-to-end handler time per prediction endpoint",
+    labelnames=("endpoint",),
+)
+PREDICTIONS_TOTAL = Counter(
+    "stroke_predictions_total",
+    "Records scored, by model or rule-based fallback path",
+    labelnames=("path",),
+)
+
+class RequestTimingMiddleware:
+    """Stamps each request on arrival so handlers can time body parsing"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["received_at"] = time.perf_counter()
+        await self.app(scope, receive, send)
+
+app.add_middleware(RequestTimingMiddleware)
+
+def observe_parse_time(request):
+    """Record time from arrival until the handler ran, i.e. body parsing and validation"""
+    received_at = getattr(request.state, "received_at", None)
+    if received_at is not None:
+        STAGE_SECONDS.observe(time.perf_counter() - received_at, stage="parse")
+
+# Check if python-multipart is installed
+try:
+    import multipart
+    logger.info(f"python-multipart is installed: {multipart.__version__}")
+except ImportError:
+    logger.warning("python-multipart is NOT installed")
+
+# Model inference runs on a bounded pool so the event loop only does parsing and I/O
+inference_pool = InferencePool(
+    max_workers=int(os.environ.get("INFERENCE_WORKERS", os.cpu_count() or 1)),
+    kind=os.environ.get("INFERENCE_POOL", "thread"),
+    on_wait=lambda wait_ms: STAGE_SECONDS.observe(wait_ms / 1000, stage="queue_wait"),
+)
+CallbackGauge("stroke_inference_in_flight", "Inference jobs submitted and not finished",
+              lambda: inference_pool.in_flight)
+CallbackGauge("stroke_inference_queue_depth", "Inference jobs waiting for a worker",
+              lambda: inference_pool.queue_depth)
+logger.info(f"Inference pool: {inference_pool.kind} with {inference_pool.max_workers} workers")
+
+# Admission control: once too much work is in progress or queued, prediction
+# requests get an immediate 503 with Retry-After instead of timing out in line
+ADMISSION_REJECTED = Counter(
+    "stroke_admission_rejected_total",
+    "Prediction requests shed by admission control, by the limit that was reached",
+    labelnames=("reason",),
+)
+admission = AdmissionController(
+    inference_pool,
+    max_in_flight=int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "256")),
+    max_queue_depth=int(os.environ.get("ADMISSION_MAX_QUEUE_DEPTH", str(8 * inference_pool.max_workers))),
+    max_retry_after=int(os.environ.get("ADMISSION_MAX_RETRY_AFTER", "30")),
+    on_reject=lambda reason: ADMISSION_REJECTED.inc(reason=reason),
+)
+CallbackGauge("stroke_requests_in_flight", "Admitted prediction requests not yet finished",
+              lambda: admission.in_flight)
+if admission.enabled:
+    logger.info(f"Admission control: up to {admission.max_in_flight or 'unlimited'} requests in flight, "
+                f"{admission.max_queue_depth or 'unlimited'} queued inference jobs")
+
+# Prediction requests are cancelled once the client's X-Request-Timeout-Ms
+# deadline passes or the client disconnects, instead of finishing for nobody
+ABANDONED_TOTAL = Counter(
+    "stroke_requests_abandoned_total",
+    "Prediction requests cancelled because their deadline passed or the client disconnected",
+    labelnames=("reason",),
+)
+DEFAULT_REQUEST_TIMEOUT_MS = float(os.environ.get("DEFAULT_REQUEST_TIMEOUT_MS", "0"))
+
+# Middleware, innermost first: admission and deadlines inside CORS so 503s and
+# 504s still carry CORS headers, and request IDs outermost so they cover everything
+app.add_middleware(AdmissionMiddleware, controller=admission)
+app.add_middleware(
+    RequestLifetimeMiddleware,
+    paths=("/api/predict",),
+    default_timeout_ms=DEFAULT_REQUEST_TIMEOUT_MS,
+    on_abandon=lambda reason: ABANDONED_TOTAL.inc(reason=reason),
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -50,17 +159,305 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestContextMiddleware)
 
-# Check if python-multipart is installed
-try:
-    import multipart
-    print("python-multipart is installed: ", multipart.__version__)
-except ImportError:
-    print("python-multipart is NOT installed")
+@app.on_event("shutdown")
+async def shutdown_inference_pool():
+    inference_pool.shutdown()
+
+# Columnar audit log of every prediction, written off the request path
+AUDIT_SCHEMA = [
+    ("timestamp", "timestamp"),
+    ("endpoint", "string"),
+    ("model_version", "string"),
+    ("gender", "string"),
+    ("age", "float64"),
+    ("hypertension", "int64"),
+    ("heart_disease", "int64"),
+    ("ever_married", "string"),
+    ("work_type", "string"),
+    ("Residence_type", "string"),
+    ("avg_glucose_level", "float64"),
+    ("bmi", "float64"),
+    ("smoking_status", "string"),
+    ("probability", "float64"),
+    ("prediction", "string"),
+    ("stroke_prediction", "int64"),
+    ("risk_factors", "list<string>"),
+    ("population_percentile", "float64"),
+    ("peer_percentile", "float64"),
+    ("execution_time_ms", "float64"),
+]
+audit_log = AuditLog(
+    os.environ.get("AUDIT_LOG_DIR"),
+    AUDIT_SCHEMA,
+    file_format=os.environ.get("AUDIT_LOG_FORMAT", "parquet"),
+    max_queue=int(os.environ.get("AUDIT_LOG_MAX_QUEUE", "10000")),
+    flush_interval=float(os.environ.get("AUDIT_LOG_FLUSH_INTERVAL", "1")),
+    rotate_bytes=int(float(os.environ.get("AUDIT_LOG_ROTATE_MB", "64")) * 1024 * 1024),
+    rotate_seconds=float(os.environ.get("AUDIT_LOG_ROTATE_SECONDS", "3600")),
+)
+if audit_log.enabled:
+    logger.info(f"Audit log: {audit_log.file_format} files in {audit_log.directory}")
+
+@app.on_event("shutdown")
+async def shutdown_audit_log():
+    audit_log.close()
+
+def audit(endpoint, processed_records, results):
+    """Queue one audit row per scored record; never blocks the request"""
+    if not audit_log.enabled:
+        return
+    base = {"timestamp": time.time(), "endpoint": endpoint, "model_version": current_model.version}
+    audit_log.record_many([{**base, **record, **result} for record, result in zip(processed_records, results)])
+
+# Upper bound on records per batch request
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "1000"))
+
+class PatientRecord(BaseModel):
+    gender: Optional[str] = None
+    age: Optional[float] = None
+    hypertension: Optional[int] = None
+    heart_disease: Optional[int] = None
+    ever_married: Optional[str] = None
+    work_type: Optional[str] = None
+    Residence_type: Optional[str] = None
+    avg_glucose_level: Optional[float] = None
+    bmi: Optional[float] = None
+    smoking_status: Optional[str] = None
+
+class BatchPredictionRequest(BaseModel):
+    records: List[PatientRecord]
+
+class TrajectoryObservation(PatientRecord):
+    # Visit date or time (ISO 8601); echoed back, and used for ordering when every visit has one
+    observed_at: Optional[str] = None
+
+class TrajectoryRequest(BaseModel):
+    observations: List[TrajectoryObservation]
+    # Fill fields a visit leaves out with the value from the visit before
+    carry_forward: bool = True
+
+class SweepAxis(BaseModel):
+    feature: str
+    # Either explicit values or an evenly spaced numeric range
+    values: Optional[List[Union[float, str]]] = None
+    start: Optional[float] = None
+    stop: Optional[float] = None
+    num: int = 50
+
+class SweepRequest(BaseModel):
+    patient: PatientRecord
+    sweep: List[SweepAxis]
+
+# Risk bands, risk factors and the fallback estimate come from a rule table
+RULES_PATH = os.environ.get("RULES_PATH")
+rule_engine = RuleEngine.from_file(RULES_PATH) if RULES_PATH else RuleEngine()
+if RULES_PATH:
+    logger.info(f"Loaded rules from {RULES_PATH}")
+
+def model_rules(model):
+    """Rule engine with the decision threshold and risk bands tuned for model, if any"""
+    if not model.tuning:
+        return rule_engine
+    if model.rules is None:
+        model.rules = rule_engine.with_tuning(model.tuning)
+    return model.rules
+
+def build_results(probabilities, processed_records, columns=None, population=None, rules=None):
+    rules = rules or rule_engine
+    results = [
+        {
+            "probability": float(probability),
+            "prediction": prediction,
+            "stroke_prediction": int(label),
+            "risk_factors": risk_factors
+        }
+        for probability, prediction, label, risk_factors in zip(
+            probabilities,
+            rules.risk_levels(probabilities),
+            rules.predictions(probabilities),
+            rules.risk_factors_batch(processed_records, columns),
+        )
+    ]
+    # Percentiles only describe model probabilities, not the rule-based estimate
+    if population is not None:
+        for result, percentiles in zip(results, population.lookup(probabilities, processed_records)):
+            result.update(percentiles)
+    return results
+
+def predict_records(processed_records, explain=False):
+    """Score a list of processed records with a single model call.
+
+    Falls back to the rule-based estimate for every record if the model
+    is unavailable or fails on the batch. With explain, model results
+    also carry per-feature attributions when the model supports them.
+    """
+    return score_records(processed_records, explain)[0]
+
+def score_records(processed_records, explain=False):
+    """predict_records, plus per record whether the model scored it (False for the fallback)"""
+    model = current_model
+    engine = model.engine
+    try:
+        if engine is None:
+            raise ValueError("Model not loaded")
+        
+        # One probability per record; the label is derived from it rather
+        # than running the classifier a second time
+        with STAGE_SECONDS.time(stage="encode"):
+            encoded = engine.encode(processed_records)
+        explanations = None
+        if explain and model.explainer is not None:
+            with STAGE_SECONDS.time(stage="predict_explain"):
+                probabilities, explanations = model.explainer.predict_and_explain(
+                    engine, processed_records, encoded
+                )
+        else:
+            with STAGE_SECONDS.time(stage="predict_proba"):
+                probabilities = engine.predict_encoded(encoded)
+        
+        with STAGE_SECONDS.time(stage="postprocess"):
+            results = build_results(probabilities, processed_records, population=model.population,
+                                    rules=model_rules(model))
+            if explanations is not None:
+                for result, explanation in zip(results, explanations):
+                    result["explanation"] = explanation
+        PREDICTIONS_TOTAL.inc(len(results), path="model")
+        return results, [True] * len(results)
+    
+    except Exception as e:
+        logger.warning(f"Error in preprocessing: {e}")
+        
+        # Isolate the failing records so the rest of the batch keeps model scores
+        if engine is not None and len(processed_records) > 1:
+            scored = [score_records([record], explain) for record in processed_records]
+            return [results[0] for results, _ in scored], [from_model[0] for _, from_model in scored]
+        
+        with STAGE_SECONDS.time(stage="fallback"):
+            columns = rule_engine.columns(processed_records)
+            probabilities = rule_engine.fallback_probabilities(processed_records, columns)
+            results = build_results(probabilities, processed_records, columns)
+        PREDICTIONS_TOTAL.inc(len(results), path="fallback")
+        return results, [False] * len(results)
+
+def score_record_pairs(processed_records):
+    # (result, from_model) per record, for the micro-batcher to hand out
+    return list(zip(*score_records(processed_records)))
+
+def predict_probabilities(processed_records, count=None):
+    """Probabilities for many records from one model call, plus the path used.
+
+    count is how many records to report in the predictions metric, when
+    the rest are auxiliary rows.
+    """
+    count = len(processed_records) if count is None else count
+    engine = current_model.engine
+    try:
+        if engine is None:
+            raise ValueError("Model not loaded")
+        with STAGE_SECONDS.time(stage="encode"):
+            encoded = engine.encode(processed_records)
+        with STAGE_SECONDS.time(stage="predict_proba"):
+            probabilities = np.asarray(engine.predict_encoded(encoded), dtype=float)
+        PREDICTIONS_TOTAL.inc(count, path="model")
+        return probabilities, "model"
+    except Exception as e:
+        logger.warning(f"Error in batch scoring: {e}")
+        with STAGE_SECONDS.time(stage="fallback"):
+            probabilities = rule_engine.fallback_probabilities(processed_records)
+        PREDICTIONS_TOTAL.inc(count, path="fallback")
+        return probabilities, "fallback"
+
+# Optional micro-batching of concurrent /api/predict calls
+if os.environ.get("MICRO_BATCHING", "false").lower() in ("1", "true", "yes"):
+    micro_batcher = MicroBatcher(
+        score_record_pairs,
+        inference_pool.run,
+        max_batch_size=int(os.environ.get("MICRO_BATCH_MAX_SIZE", "32")),
+        max_wait_ms=float(os.environ.get("MICRO_BATCH_MAX_WAIT_MS", "5")),
+    )
+    logger.info(f"Micro-batching enabled: up to {micro_batcher.max_batch_size} records "
+                f"or {micro_batcher.max_wait * 1000:.1f} ms per batch")
+else:
+    micro_batcher = None
+
+# Cache of model predictions keyed on canonicalized processed inputs
+prediction_cache = PredictionCache(
+    max_size=int(os.environ.get("PREDICTION_CACHE_SIZE", "10000")),
+    ttl_seconds=float(os.environ.get("PREDICTION_CACHE_TTL", "3600")),
+    precision=int(os.environ.get("PREDICTION_CACHE_PRECISION", "2")),
+)
+prediction_cache.bind_model(current_model.version)
+
+def use_prediction_cache():
+    # Rule-based fallback results are never cached
+    return prediction_cache.enabled and current_model.available
+
+def observe_drift(model, processed_records, results, from_model):
+    # Cached results count too: drift is about the traffic, not the model calls.
+    # Only the model's own scores go into the probability histogram.
+    if model.drift is not None:
+        model.drift.observe(processed_records,
+                            [result["probability"] for result, scored in zip(results, from_model) if scored])
+
+async def score_single(processed_data, explain=False):
+    """Score one record, coalescing with concurrent requests when enabled"""
+    model = current_model
+    if explain:
+        # Explanations bypass the cache and micro-batcher
+        results, from_model = await inference_pool.run(score_records, [processed_data], True)
+        observe_drift(model, [processed_data], results, from_model)
+        return results[0]
+    model_version = model.version
+    if use_prediction_cache():
+        cache_key = prediction_cache.key(processed_data)
+        cached = prediction_cache.get(cache_key)
+        if cached is not None:
+            # Only model results are cached
+            observe_drift(model, [processed_data], [cached], [True])
+            return cached
+    
+    if micro_batcher is not None:
+        result, scored_by_model = await micro_batcher.submit(processed_data)
+    else:
+        results, from_model = await inference_pool.run(score_records, [processed_data])
+        result, scored_by_model = results[0], from_model[0]
+    
+    if scored_by_model and use_prediction_cache():
+        prediction_cache.put(cache_key, result, model_version)
+    observe_drift(model, [processed_data], [result], [scored_by_model])
+    return result
+
+async def score_batch(processed_records, explain=False):
+    """Score many records in one model call, skipping cached ones"""
+    model = current_model
+    if explain:
+        results, from_model = await inference_pool.run(score_records, processed_records, True)
+    elif not use_prediction_cache():
+        results, from_model = await inference_pool.run(score_records, processed_records)
+    else:
+        model_version = model.version
+        cache_keys = [prediction_cache.key(record) for record in processed_records]
+        results = [prediction_cache.get(cache_key) for cache_key in cache_keys]
+        from_model = [True] * len(results)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            scored, scored_by_model = await inference_pool.run(
+                score_records, [processed_records[i] for i in missing]
+            )
+            for i, result, by_model in zip(missing, scored, scored_by_model):
+                if by_model:
+                    prediction_cache.put(cache_keys[i], result, model_version)
+                results[i] = result
+                from_model[i] = by_model
+    observe_drift(model, processed_records, results, from_model)
+    return results
 
 # Define prediction endpoints
 @app.post("/api/predict")
 async def predict_stroke(
+    request: Request,
     gender: Optional[str] = Form(None),
     age: Optional[float] = Form(None),
     hypertension: Optional[int] = Form(None),
@@ -70,11 +467,12 @@ async def predict_stroke(
     Residence_type: Optional[str] = Form(None),
     avg_glucose_level: Optional[float] = Form(None),
     bmi: Optional[float] = Form(None),
-    smoking_status: Optional[str] = Form(None)
+    smoking_status: Optional[str] = Form(None),
+    explain: bool = False
 ):
     start_time = time.time()
+    observe_parse_time(request)
     
-    # Log the received data
     form_data = {
         'gender': gender,
         'age': age,
@@ -87,150 +485,486 @@ async def predict_stroke(
         'bmi': bmi,
         'smoking_status': smoking_status
     }
-    print("Received form data:", form_data)
     
     # Process data and fill default values if needed
-    processed_data = {
-        'gender': gender if gender else 'Male',
-        'age': float(age) if age is not None else 0,
-        'hypertension': int(hypertension) if hypertension is not None else 0,
-        'heart_disease': int(heart_disease) if heart_disease is not None else 0,
-        'ever_married': ever_married if ever_married else 'No',
-        'work_type': work_type if work_type else 'Private',
-        'Residence_type': Residence_type if Residence_type else 'Urban',
-        'avg_glucose_level': float(avg_glucose_level) if avg_glucose_level is not None else 0,
-        'bmi': float(bmi) if bmi is not None else 0,
-        'smoking_status': smoking_status if smoking_status else 'never smoked'
+    with STAGE_SECONDS.time(stage="preprocess"):
+        processed_data = preprocess_input(form_data)
+    
+    # Prediction with fallback
+    result = await score_single(processed_data, explain)
+    result["execution_time_ms"] = (time.time() - start_time) * 1000
+    REQUEST_SECONDS.observe(result["execution_time_ms"] / 1000, endpoint="/api/predict")
+    audit("/api/predict", [processed_data], [result])
+    return result
+
+@app.post("/api/predict/batch")
+async def predict_stroke_batch(batch: BatchPredictionRequest, request: Request, explain: bool = False):
+    start_time = time.time()
+    observe_parse_time(request)
+    
+    if len(batch.records) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch contains {len(batch.records)} records; the limit is {MAX_BATCH_SIZE}"
+        )
+    
+    with STAGE_SECONDS.time(stage="preprocess"):
+        processed_records = [
+            preprocess_input({field: getattr(record, field) for field in INPUT_FIELDS})
+            for record in batch.records
+        ]
+    results = await score_batch(processed_records, explain)
+    
+    # Each entry mirrors the /api/predict response; timing covers the whole batch
+    execution_time_ms = (time.time() - start_time) * 1000
+    REQUEST_SECONDS.observe(execution_time_ms / 1000, endpoint="/api/predict/batch")
+    for result in results:
+        result["execution_time_ms"] = execution_time_ms
+    audit("/api/predict/batch", processed_records, results)
+    
+    logger.info("Batch prediction: %d records in %.2f ms", len(results), execution_time_ms,
+                extra={"records": len(results), "execution_time_ms": execution_time_ms})
+    return {
+        "predictions": results,
+        "count": len(results),
+        "execution_time_ms": execution_time_ms
     }
-    print("Processed data for prediction:", processed_data)
+
+# JSON variants of the prediction endpoints: no form parsing, a precompiled
+# validator and orjson for both directions
+logger.info(f"JSON endpoints use {JSON_LIBRARY}")
+
+@app.post("/api/predict/json")
+async def predict_stroke_json(request: Request, explain: bool = False):
+    start_time = time.time()
+    try:
+        data = parse_record(await request.body())
+    except SchemaValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors)
+    observe_parse_time(request)
     
-    # Create a DataFrame from the processed data
-    input_df = pd.DataFrame([processed_data])
+    with STAGE_SECONDS.time(stage="preprocess"):
+        processed_data = preprocess_input(data)
+    result = await score_single(processed_data, explain)
+    result["execution_time_ms"] = (time.time() - start_time) * 1000
+    REQUEST_SECONDS.observe(result["execution_time_ms"] / 1000, endpoint="/api/predict/json")
+    audit("/api/predict/json", [processed_data], [result])
     
-    # Prediction with fallback
+    with STAGE_SECONDS.time(stage="serialize"):
+        return FastJSONResponse(result)
+
+@app.post("/api/predict/json/batch")
+async def predict_stroke_json_batch(request: Request, explain: bool = False):
+    start_time = time.time()
     try:
-        if model_info is None:
-            raise ValueError("Model not loaded")
-        
-        # Get prediction from model
-        prediction_proba = pipeline.predict_proba(input_df)[0][1]
-        prediction_binary = pipeline.predict(input_df)[0]
-        
-        # Calculate risk level
-        if prediction_proba < 0.1:
-            risk_level = "Very Low Risk"
-        elif prediction_proba < 0.3:
-            risk_level = "Low Risk"
-        elif prediction_proba < 0.6:
-            risk_level = "Moderate Risk"
-        else:
-            risk_level = "High Risk"
-            
-        # Identify risk factors
-        risk_factors = []
-        if processed_data['hypertension'] == 1:
-            risk_factors.append("Hypertension")
-        if processed_data['heart_disease'] == 1:
-            risk_factors.append("Heart Disease")
-        if processed_data['age'] > 65:
-            risk_factors.append("Advanced Age (65+)")
-        if processed_data['avg_glucose_level'] > 140:
-            risk_factors.append("High Blood Glucose (>140)")
-        if processed_data['bmi'] > 30:
-            risk_factors.append("Obesity (BMI > 30)")
-        if processed_data['smoking_status'] == 'formerly smoked':
-            risk_factors.append("Former Smoker")
-        if processed_data['smoking_status'] == 'smokes':
-            risk_factors.append("Current Smoker")
-        
-        # Return results
-        result = {
-            "probability": float(prediction_proba),
-            "prediction": risk_level,
-            "stroke_prediction": int(prediction_binary),
-            "risk_factors": risk_factors,
-            "execution_time_ms": (time.time() - start_time) * 1000
-        }
-        
-    except Exception as e:
-        print("Error in preprocessing:", e)
-        
-        # Alternative risk calculation
-        alternative_probability = 0.05  # Default low risk
-        
-        # Increase risk based on known factors
-        if processed_data['hypertension'] == 1:
-            alternative_probability += 0.1
-            
-        if processed_data['heart_disease'] == 1:
-            alternative_probability += 0.1
-            
-        if processed_data['age'] > 65:
-            alternative_probability += 0.15
-        elif processed_data['age'] > 55:
-            alternative_probability += 0.1
-            
-        if processed_data['avg_glucose_level'] > 180:
-            alternative_probability += 0.1
-        elif processed_data['avg_glucose_level'] > 140:
-            alternative_probability += 0.05
-            
-        if processed_data['bmi'] > 30:
-            alternative_probability += 0.05
-            
-        if processed_data['smoking_status'] == 'smokes':
-            alternative_probability += 0.07
-        elif processed_data['smoking_status'] == 'formerly smoked':
-            alternative_probability += 0.03
-            
-        # Cap at 80%
-        alternative_probability = min(alternative_probability, 0.8)
-        
-        # Determine risk level
-        if alternative_probability < 0.1:
-            risk_level = "Very Low Risk"
-        elif alternative_probability < 0.3:
-            risk_level = "Low Risk"
-        elif alternative_probability < 0.6:
-            risk_level = "Moderate Risk"
+        records = parse_batch(await request.body())
+    except SchemaValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors)
+    observe_parse_time(request)
+    
+    if len(records) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch contains {len(records)} records; the limit is {MAX_BATCH_SIZE}"
+        )
+    
+    with STAGE_SECONDS.time(stage="preprocess"):
+        processed_records = [preprocess_input(record) for record in records]
+    results = await score_batch(processed_records, explain)
+    
+    execution_time_ms = (time.time() - start_time) * 1000
+    REQUEST_SECONDS.observe(execution_time_ms / 1000, endpoint="/api/predict/json/batch")
+    for result in results:
+        result["execution_time_ms"] = execution_time_ms
+    audit("/api/predict/json/batch", processed_records, results)
+    
+    logger.info("JSON batch prediction: %d records in %.2f ms", len(results), execution_time_ms,
+                extra={"records": len(results), "execution_time_ms": execution_time_ms})
+    with STAGE_SECONDS.time(stage="serialize"):
+        return FastJSONResponse({
+            "predictions": results,
+            "count": len(results),
+            "execution_time_ms": execution_time_ms
+        })
+
+# Upper bound on grid points per sweep request
+MAX_SWEEP_POINTS = int(os.environ.get("MAX_SWEEP_POINTS", "10000"))
+
+def sweep_values(axis, patient):
+    """Grid values for one axis, coerced the same way as request fields"""
+    if axis.feature not in INPUT_FIELDS:
+        raise ValueError(f"Unknown feature: {axis.feature}")
+    if axis.values is not None:
+        values = axis.values
+    elif axis.start is not None and axis.stop is not None and axis.num > 0:
+        values = np.linspace(axis.start, axis.stop, axis.num).tolist()
+    else:
+        raise ValueError(f"Sweep of {axis.feature} needs values or start, stop and num")
+    if not values:
+        raise ValueError(f"Sweep of {axis.feature} has no values")
+    return [preprocess_input({**patient, axis.feature: value})[axis.feature] for value in values]
+
+@app.post("/api/predict/sweep")
+async def predict_stroke_sweep(sweep: SweepRequest, request: Request):
+    """Score a base patient over a grid of one or two features in one model call"""
+    start_time = time.time()
+    observe_parse_time(request)
+    
+    if not 1 <= len(sweep.sweep) <= 2:
+        raise HTTPException(status_code=422, detail="Sweep one or two features")
+    if len(sweep.sweep) == 2 and sweep.sweep[0].feature == sweep.sweep[1].feature:
+        raise HTTPException(status_code=422, detail="Sweep two different features")
+    patient = {field: getattr(sweep.patient, field) for field in INPUT_FIELDS}
+    try:
+        axes = [sweep_values(axis, patient) for axis in sweep.sweep]
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    shape = tuple(len(values) for values in axes)
+    if int(np.prod(shape)) > MAX_SWEEP_POINTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Sweep has {int(np.prod(shape))} points; the limit is {MAX_SWEEP_POINTS}"
+        )
+    
+    # Every grid point plus the unmodified patient, scored as one batch
+    with STAGE_SECONDS.time(stage="preprocess"):
+        base = preprocess_input(patient)
+        features = [axis.feature for axis in sweep.sweep]
+        if len(axes) == 1:
+            grid = [{**base, features[0]: a} for a in axes[0]]
         else:
-            risk_level = "High Risk"
-            
-        # Threshold for binary prediction
-        stroke_prediction = 1 if alternative_probability > 0.5 else 0
-        
-        # Identify risk factors
-        risk_factors = []
-        if processed_data['hypertension'] == 1:
-            risk_factors.append("Hypertension")
-        if processed_data['heart_disease'] == 1:
-            risk_factors.append("Heart Disease")
-        if processed_data['age'] > 65:
-            risk_factors.append("Advanced Age (65+)")
-        if processed_data['avg_glucose_level'] > 140:
-            risk_factors.append("High Blood Glucose (>140)")
-        if processed_data['bmi'] > 30:
-            risk_factors.append("Obesity (BMI > 30)")
-        if processed_data['smoking_status'] == 'formerly smoked':
-            risk_factors.append("Former Smoker")
-        if processed_data['smoking_status'] == 'smokes':
-            risk_factors.append("Current Smoker")
-        
-        result = {
-            "probability": alternative_probability,
-            "prediction": risk_level,
-            "stroke_prediction": stroke_prediction,
-            "risk_factors": risk_factors,
-            "execution_time_ms": (time.time() - start_time) * 1000
-        }
+            grid = [{**base, features[0]: a, features[1]: b} for a in axes[0] for b in axes[1]]
+        grid.append(base)
+    model = current_model
+    probabilities, path = await inference_pool.run(predict_probabilities, grid)
     
-    print("Prediction result:", result)
-    return result
+    execution_time_ms = (time.time() - start_time) * 1000
+    REQUEST_SECONDS.observe(execution_time_ms / 1000, endpoint="/api/predict/sweep")
+    logger.info("Sweep prediction: %d points over %s in %.2f ms", len(grid) - 1, features, execution_time_ms,
+                extra={"records": len(grid) - 1, "execution_time_ms": execution_time_ms})
+    base_probability = float(probabilities[-1])
+    with STAGE_SECONDS.time(stage="serialize"):
+        return FastJSONResponse({
+            "features": features,
+            "values": axes,
+            # probabilities[i][j] is the risk at values[0][i] and values[1][j]
+            "probabilities": probabilities[:-1].reshape(shape).tolist(),
+            "base_probability": base_probability,
+            "base_prediction": (model_rules(model) if path == "model" else rule_engine).risk_level(base_probability),
+            "using_model": path == "model",
+            "points": len(grid) - 1,
+            "execution_time_ms": execution_time_ms
+        })
+
+def parse_observed_at(value):
+    """ISO 8601 date or date-time; a trailing Z means UTC (Python 3.10's fromisoformat rejects it)"""
+    value = value.strip()
+    if value[-1:] in ("Z", "z"):
+        value = value[:-1] + "+00:00"
+    return datetime.fromisoformat(value)
+
+
+def order_visits(observations):
+    """Observations sorted by observed_at when every one has it, else in the order given"""
+    if not all(observation.observed_at for observation in observations):
+        return list(observations)
+    try:
+        times = [parse_observed_at(observation.observed_at) for observation in observations]
+        order = sorted(range(len(observations)), key=times.__getitem__)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"observed_at must be ISO 8601 dates or times of one kind: {e}")
+    return [observations[i] for i in order]
+
+def score_trajectory(processed_records):
+    """Probabilities for every visit and the effect of each changed input, from one model call.
+
+    An input that changed since the previous visit is credited with the
+    visit's probability minus the probability of the same visit with that
+    input set back to its previous value. Those substituted rows are scored
+    in the same call as the visits, so the effects are in the same space as
+    the deltas (calibrated, for a tuned artifact). Returns the visit
+    probabilities, {field: effect} per visit (empty for the first) and the
+    path used.
+    """
+    substituted, owners = [], []
+    for i in range(1, len(processed_records)):
+        previous, current = processed_records[i - 1], processed_records[i]
+        for field in INPUT_FIELDS:
+            if previous[field] != current[field]:
+                substituted.append({**current, field: previous[field]})
+                owners.append((i, field))
+    count = len(processed_records)
+    probabilities, path = predict_probabilities(processed_records + substituted, count=count)
+    probabilities, substituted_probabilities = probabilities[:count], probabilities[count:]
+    effects = [{} for _ in processed_records]
+    for (i, field), probability in zip(owners, substituted_probabilities.tolist()):
+        effects[i][field] = float(probabilities[i]) - probability
+    return probabilities, effects, path
+
+@app.post("/api/predict/trajectory")
+async def predict_stroke_trajectory(trajectory: TrajectoryRequest, request: Request):
+    """Score a patient's visits in one model call, with the change between visits and what drove it"""
+    start_time = time.time()
+    observe_parse_time(request)
+    
+    if not trajectory.observations:
+        raise HTTPException(status_code=422, detail="Trajectory needs at least one observation")
+    if len(trajectory.observations) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Trajectory has {len(trajectory.observations)} observations; the limit is {MAX_BATCH_SIZE}"
+        )
+    try:
+        observations = order_visits(trajectory.observations)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    with STAGE_SECONDS.time(stage="preprocess"):
+        raw_records = []
+        for observation in observations:
+            raw = {field: getattr(observation, field) for field in INPUT_FIELDS}
+            if trajectory.carry_forward and raw_records:
+                raw = {field: raw_records[-1][field] if value is None else value for field, value in raw.items()}
+            raw_records.append(raw)
+        processed_records = [preprocess_input(raw) for raw in raw_records]
+    model = current_model
+    probabilities, effects, path = await inference_pool.run(score_trajectory, processed_records)
+    
+    with STAGE_SECONDS.time(stage="postprocess"):
+        using_model = path == "model"
+        visits = build_results(probabilities, processed_records,
+                               population=model.population if using_model else None,
+                               rules=model_rules(model) if using_model else rule_engine)
+        deltas = np.diff(probabilities)
+        for i, (observation, visit) in enumerate(zip(observations, visits)):
+            visit["observed_at"] = observation.observed_at
+            if i == 0:
+                visit.update(delta=None, changed_inputs={}, drivers=None, interaction=None)
+                continue
+            previous, current = processed_records[i - 1], processed_records[i]
+            delta = float(deltas[i - 1])
+            visit["delta"] = delta
+            visit["changed_inputs"] = {
+                field: {"from": previous[field], "to": current[field]}
+                for field in INPUT_FIELDS if previous[field] != current[field]
+            }
+            # Only changed inputs, largest effect first; the interaction term is
+            # the part of the delta no single input accounts for
+            visit["drivers"] = dict(sorted(effects[i].items(), key=lambda item: -abs(item[1])))
+            visit["interaction"] = delta - sum(effects[i].values())
+    observe_drift(model, processed_records, visits, [using_model] * len(visits))
+    
+    execution_time_ms = (time.time() - start_time) * 1000
+    REQUEST_SECONDS.observe(execution_time_ms / 1000, endpoint="/api/predict/trajectory")
+    for visit in visits:
+        visit["execution_time_ms"] = execution_time_ms
+    audit("/api/predict/trajectory", processed_records, visits)
+    logger.info("Trajectory prediction: %d visits in %.2f ms", len(visits), execution_time_ms,
+                extra={"records": len(visits), "execution_time_ms": execution_time_ms})
+    if not using_model:
+        space = "rule-based estimate"
+    elif isinstance(model.engine, CalibratedEngine):
+        space = "calibrated probability"
+    else:
+        space = "probability"
+    with STAGE_SECONDS.time(stage="serialize"):
+        return FastJSONResponse({
+            "visits": visits,
+            "probabilities": probabilities.tolist(),
+            "deltas": deltas.tolist(),
+            "total_change": float(probabilities[-1] - probabilities[0]),
+            # Drivers and deltas are in the same space, so drivers plus interaction sum to delta
+            "explanation": {"method": "substitution", "space": space},
+            "using_model": using_model,
+            "count": len(visits),
+            "execution_time_ms": execution_time_ms
+        })
+
+# Rows parsed and scored per chunk when streaming CSV files
+CSV_CHUNK_SIZE = int(os.environ.get("CSV_CHUNK_SIZE", "5000"))
+
+def score_csv_chunk(header, rows):
+    return score_rows(header, rows, preprocess_input, predict_records)
+
+@app.post("/api/predict/csv")
+async def predict_stroke_csv(request: Request):
+    """Score a test.csv-shaped upload and stream back id,stroke rows.
+
+    The request body is the raw CSV. Rows are scored in fixed-size chunks
+    as they arrive, so results start streaming before the upload finishes.
+    """
+    chunker = CsvChunker(chunk_size=CSV_CHUNK_SIZE)
+    
+    async def stream_predictions():
+        start_time = time.time()
+        invalid = 0
+        yield SUBMISSION_HEADER
+        async for data in request.stream():
+            for rows in chunker.feed(data):
+                lines, rejected = await inference_pool.run(score_csv_chunk, chunker.header, rows)
+                invalid += rejected
+                yield lines
+        for rows in chunker.finish():
+            lines, rejected = await inference_pool.run(score_csv_chunk, chunker.header, rows)
+            invalid += rejected
+            yield lines
+        REQUEST_SECONDS.observe(time.time() - start_time, endpoint="/api/predict/csv")
+        execution_time_ms = (time.time() - start_time) * 1000
+        logger.info("CSV prediction: %d rows (%d invalid) in %.2f ms", chunker.rows_read, invalid,
+                    execution_time_ms,
+                    extra={"records": chunker.rows_read, "invalid": invalid, "execution_time_ms": execution_time_ms})
+    
+    return RequestStreamingResponse(stream_predictions(), media_type="text/csv")
 
 @app.get("/")
 async def root():
     return {"message": "Stroke Prediction API is running! Use /api/predict for predictions."}
 
+@app.get("/health")
+async def health():
+    """Liveness and load for load balancers; never shed by admission control"""
+    model = current_model
+    return {
+        "status": "ok" if model.available else "degraded",
+        "model_version": model.version,
+        "in_flight": admission.in_flight,
+        "queue_depth": inference_pool.queue_depth,
+    }
+
+# Hot reload of the model artifact, via the admin endpoint or a file watcher
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+MODEL_WATCH_INTERVAL = float(os.environ.get("MODEL_WATCH_INTERVAL", "0"))
+reload_lock = asyncio.Lock()
+reload_stats = {"succeeded": 0, "failed": 0, "last_error": None, "last_attempt_at": None}
+
+def install_model(new_model):
+    """Swap in a loaded model and return the one it replaced"""
+    global current_model
+    previous_model, current_model = current_model, new_model
+    prediction_cache.bind_model(new_model.version)
+    # Process workers hold their own copy of the model; start fresh ones
+    if inference_pool.kind == "process":
+        inference_pool.recycle()
+    return previous_model
+
+async def reload_model():
+    """Load and verify the artifact in the background, then swap it in.
+
+    Requests keep using the current model while the new one loads. If
+    loading or verification fails, the current model stays in place.
+    """
+    async with reload_lock:
+        reload_stats["last_attempt_at"] = time.time()
+        loop = asyncio.get_running_loop()
+        try:
+            new_model = await loop.run_in_executor(
+                None, load_model, SCORING_ENGINE, MODEL_PATH, ONNX_MODEL_PATH, MODEL_MMAP,
+                POPULATION_DATA, DRIFT_WINDOW_SIZE
+            )
+        except Exception as e:
+            reload_stats["failed"] += 1
+            reload_stats["last_error"] = str(e)
+            logger.error(f"Model reload failed, keeping version {current_model.version}: {e}")
+            raise
+        
+        previous_model = install_model(new_model)
+        reload_stats["succeeded"] += 1
+        reload_stats["last_error"] = None
+        logger.info(f"Model reloaded: {previous_model.version} -> {new_model.version}")
+        return previous_model, new_model
+
+@app.post("/api/admin/reload")
+async def admin_reload(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    try:
+        previous_model, new_model = await reload_model()
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"status": "failed", "error": str(e), "model": current_model.describe()}
+        )
+    return {
+        "status": "reloaded",
+        "previous_version": previous_model.version,
+        "model": new_model.describe()
+    }
+
+async def watch_model_file():
+    """Reload whenever the served artifact's mtime or size changes"""
+    try:
+        last_seen = artifact_version(SERVED_MODEL_PATH)
+    except OSError:
+        last_seen = None
+    while True:
+        await asyncio.sleep(MODEL_WATCH_INTERVAL)
+        try:
+            seen = artifact_version(SERVED_MODEL_PATH)
+        except OSError:
+            continue
+        if seen != last_seen:
+            last_seen = seen
+            try:
+                await reload_model()
+            except Exception:
+                pass
+
+model_watch_task = None
+
+@app.on_event("startup")
+async def start_model_watcher():
+    global model_watch_task
+    if MODEL_WATCH_INTERVAL > 0:
+        logger.info(f"Watching {SERVED_MODEL_PATH} for changes every {MODEL_WATCH_INTERVAL:g} s")
+        model_watch_task = asyncio.create_task(watch_model_file())
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/drift")
+async def drift():
+    """Drift of recent inputs and probabilities from the reference population"""
+    model = current_model
+    if model.drift is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Drift monitoring is disabled (needs POPULATION_DATA and DRIFT_WINDOW_SIZE > 0)"
+        )
+    return FastJSONResponse({"model_version": model.version, **model.drift.report()})
+
+@app.get("/api/stats")
+async def stats():
+    return {
+        "model": current_model.describe(),
+        "reloads": reload_stats,
+        "process": prefork.memory_report(),
+        "inference_pool": inference_pool.stats(),
+        "admission": admission.stats(),
+        "deadlines": request_stats(),
+        "micro_batcher": micro_batcher.stats() if micro_batcher else {"enabled": False},
+        "prediction_cache": prediction_cache.stats(),
+        "audit_log": audit_log.stats(),
+        "logging": {"dropped": dropped_records()}
+    }
+
+def reload_model_in_parent():
+    """SIGHUP handler for pre-fork mode: load and install before re-forking"""
+    install_model(load_model(SCORING_ENGINE, MODEL_PATH, ONNX_MODEL_PATH, MODEL_MMAP, POPULATION_DATA,
+                             DRIFT_WINDOW_SIZE))
+
 # Run the server
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=7860)
+    web_workers = int(os.environ.get("WEB_WORKERS", "1"))
+    if web_workers > 1:
+        # Model is already loaded; workers forked from here share it copy-on-write
+        prefork.serve_prefork(
+            app, "0.0.0.0", 7860, web_workers,
+            reload_model=reload_model_in_parent,
+            memory_report_interval=float(os.environ.get("MEMORY_REPORT_INTERVAL", "0")),
+        )
+    else:
+        # Logging is already configured; keep uvicorn from replacing it
+        uvicorn.run(app, host="0.0.0.0", port=7860, log_config=None, access_log=False)
@@ -0,0 +1,232 @@
+"""Batched, asynchronous audit log of predictions in columnar files.
+
+Request handlers call record() or record_many(), which only append to a
+bounded in-memory queue and never wait on I/O; rows that arrive while the
+queue is full are counted as dropped. A background thread drains the
+queue every flush_interval seconds, or as soon as batch_size rows are
+waiting, and writes each batch as one Parquet row group or Arrow IPC
+record batch. Files rotate by size and age, and are written under an
+.inprogress name that is renamed when the file is complete, so readers
+only ever see finished files:
+
+    audit-20240101-120000-<pid>-<sequence>.parquet
+
+pyarrow is optional: without it the sink writes JSON Lines instead.
+
+This module is vendored into each Space; keep the copies identical.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow", "jsonl": ".jsonl"}
+
+
+def _arrow_type(name):
+    return {
+        "string": pa.string(),
+        "float64": pa.float64(),
+        "int64": pa.int64(),
+        "bool": pa.bool_(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "list<string>": pa.list_(pa.string()),
+    }[name]
+
+
+class AuditLog:
+    """Bounded queue of row dicts flushed to rotating files by a background thread.
+
+    schema is a list of (column, type) pairs, with types from "string",
+    "float64", "int64", "bool", "timestamp" (epoch seconds) and
+    "list<string>". Row keys outside the schema are ignored.
+    """
+
+    def __init__(self, directory=None, schema=(), file_format="parquet", max_queue=10000, batch_size=1000,
+                 flush_interval=1.0, rotate_bytes=64 * 1024 * 1024, rotate_seconds=3600, prefix="audit"):
+        self.directory = directory
+        self.enabled = bool(directory)
+        self.schema = list(schema)
+        if file_format not in EXTENSIONS:
+            raise ValueError(f"Unknown audit log format: {file_format}")
+        if pa is None and file_format != "jsonl":
+            logger.warning(f"pyarrow is not installed; audit log falls back to JSON Lines instead of {file_format}")
+            file_format = "jsonl"
+        self.file_format = file_format
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.prefix = prefix
+        self.arrow_schema = pa.schema([(name, _arrow_type(kind)) for name, kind in self.schema]) if pa else None
+
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._queue = deque()
+        self._closing = False
+        self._thread = None
+        self._writer = None
+        self._file = None
+        self._path = None
+        self._opened_at = 0.0
+        self._sequence = 0
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.files_completed = 0
+        self.last_error = None
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.close)
+            # Threads don't survive fork; a forked worker starts its own writer on first use
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def record(self, row):
+        self.record_many([row])
+
+    def record_many(self, rows):
+        """Queue rows for writing without blocking; rows beyond the queue bound are dropped"""
+        if not self.enabled:
+            return
+        if self._thread is None:
+            self._start()
+        with self._lock:
+            space = self.max_queue - len(self._queue)
+            accepted = rows if len(rows) <= space else rows[:max(space, 0)]
+            self._queue.extend(accepted)
+            self.enqueued += len(accepted)
+            self.dropped += len(rows) - len(accepted)
+            if len(self._queue) >= self.batch_size:
+                self._wake.notify()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+                self._thread.start()
+
+    def _reset_after_fork(self):
+        # The parent keeps writing its own queue and file
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._queue = deque()
+        self._thread = None
+        self._writer = None
+        self._file = None
+        self._closing = False
+        self._sequence = 0
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._closing and len(self._queue) < self.batch_size:
+                    self._wake.wait(self.flush_interval)
+                rows = [self._queue.popleft() for _ in range(min(len(self._queue), self.batch_size))]
+                closing = self._closing and not self._queue
+            if rows:
+                self._write(rows)
+            elif self._writer is not None and time.time() - self._opened_at >= self.rotate_seconds:
+                self._finish_file()
+            if closing:
+                self._finish_file()
+                return
+
+    def _write(self, rows):
+        try:
+            if self._writer is None:
+                self._open_file()
+            if self.file_format == "jsonl":
+                self._writer.write("".join(json.dumps(row, default=str) + "\n" for row in rows))
+                self._writer.flush()
+            else:
+                self._writer.write_table(self._table(rows))
+                if self._file is not None:
+                    self._file.flush()
+            self.written += len(rows)
+            self.batches += 1
+            if (os.path.getsize(self._path) >= self.rotate_bytes
+                    or time.time() - self._opened_at >= self.rotate_seconds):
+                self._finish_file()
+        except Exception as e:
+            self.failed += len(rows)
+            self.last_error = str(e)
+            logger.error(f"Audit log write failed ({len(rows)} rows): {e}")
+
+    def _table(self, rows):
+        columns = []
+        for name, kind in self.schema:
+            values = [row.get(name) for row in rows]
+            if kind == "timestamp":
+                values = [None if v is None else int(v * 1_000_000) for v in values]
+            columns.append(pa.array(values, type=self.arrow_schema.field(name).type))
+        return pa.Table.from_arrays(columns, schema=self.arrow_schema)
+
+    def _open_file(self):
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+        self._sequence += 1
+        name = f"{self.prefix}-{stamp}-{os.getpid()}-{self._sequence:04d}{EXTENSIONS[self.file_format]}"
+        self._path = os.path.join(self.directory, name + ".inprogress")
+        self._opened_at = time.time()
+        if self.file_format == "jsonl":
+            self._writer = open(self._path, "w")
+        elif self.file_format == "parquet":
+            self._writer = pq.ParquetWriter(self._path, self.arrow_schema)
+        else:
+            self._file = pa.OSFile(self._path, "wb")
+            self._writer = pa.ipc.new_file(self._file, self.arrow_schema)
+
+    def _finish_file(self):
+        if self._writer is None:
+            return
+        try:
+            self._writer.close()
+            if self._file is not None:
+                self._file.close()
+            os.replace(self._path, self._path[:-len(".inprogress")])
+            self.files_completed += 1
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Audit log could not close {self._path}: {e}")
+        self._writer = None
+        self._file = None
+
+    def close(self, timeout=10.0):
+        """Write whatever is queued and complete the current file"""
+        if self._thread is None:
+            return
+        with self._lock:
+            self._closing = True
+            self._wake.notify()
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "directory": self.directory,
+            "format": self.file_format,
+            "queued": len(self._queue),
+            "max_queue": self.max_queue,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "files_completed": self.files_completed,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""Replay benchmark for the stroke service.
+
+Replays rows from train.csv and/or test.csv against the API and reports
+throughput and p50/p95/p99 request latency for five modes:
+
+  single      one /api/predict request at a time
+  batch       /api/predict/batch with --batch-size records per request
+  concurrent  --concurrency clients issuing /api/predict in parallel
+  json        one /api/predict/json request at a time
+  json_batch  /api/predict/json/batch with --batch-size records per request
+
+Usage:
+    python benchmark.py                          # in-process, model and fallback paths
+    python benchmark.py --url http://localhost:7860 --modes single concurrent
+    python benchmark.py --data test --rows 5000 --json results.json
+    python benchmark.py --codec                  # request parse / response serialize cost only
+    python benchmark.py --explain                # attribution overhead vs the model call
+
+In-process runs import app.py and drive it through httpx's ASGI transport,
+so the full request path (form parsing, pool, batching) is exercised
+without a socket. Each mode runs once on the model path and once with the
+scoring engine detached to time the rule-based fallback. The prediction
+cache and admission control are disabled unless --keep-cache or
+--keep-admission is given. Over HTTP the server's configuration decides
+which path is measured. Requests shed by admission control (503) are
+counted in the "shed" column and left out of the latencies and
+throughput. The service logs errors only unless LOG_LEVEL is set.
+Requires httpx.
+
+--codec skips scoring and times only decoding/validating request bodies
+and encoding responses, for the Form endpoints (python-multipart plus
+pydantic, FastAPI's jsonable_encoder and JSONResponse) against the JSON
+endpoints (json_api's decoder, validators and FastJSONResponse).
+
+--explain times the loaded engine's model call with and without
+per-feature attributions, for several batch sizes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from scoring_engines import INPUT_FIELDS
+
+DATA_FILES = {"train": "train.csv", "test": "test.csv"}
+
+
+def import_service():
+    """Import app.py logging errors only, so per-request lines don't skew timings.
+
+    The fallback pass would otherwise log a warning per request. Errors and
+    tracebacks from failed requests still reach stdout; an explicit
+    LOG_LEVEL wins.
+    """
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    import app
+    return app
+
+
+def load_rows(data, limit):
+    frames = []
+    names = ["train", "test"] if data == "both" else [data]
+    for name in names:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), DATA_FILES[name])
+        frames.append(pd.read_csv(path, usecols=INPUT_FIELDS))
+    rows = pd.concat(frames, ignore_index=True)
+    if limit:
+        rows = rows.head(limit)
+    # Form fields travel as strings; NaN becomes a missing field
+    return [{k: v for k, v in row.items() if pd.notna(v)} for row in rows.to_dict("records")]
+
+
+def accepted(response):
+    """False if admission control shed the request; raises on any other error"""
+    if response.status_code == 503:
+        return False
+    response.raise_for_status()
+    return True
+
+
+def summarize(mode, path, latencies, records, shed, elapsed):
+    latencies = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else [float("nan")] * 3
+    return {
+        "mode": mode,
+        "path": path,
+        "requests": len(latencies),
+        "records": records,
+        "shed": shed,
+        "seconds": elapsed,
+        "requests_per_s": len(latencies) / elapsed,
+        "records_per_s": records / elapsed,
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+    }
+
+
+async def post_single(client, row, latencies):
+    """Post one record; returns whether it was scored rather than shed"""
+    start = time.perf_counter()
+    response = await client.post("/api/predict", data=row)
+    elapsed = time.perf_counter() - start
+    if not accepted(response):
+        return False
+    latencies.append(elapsed)
+    return True
+
+
+async def run_single(client, rows, args):
+    latencies = []
+    start = time.perf_counter()
+    scored = 0
+    for row in rows:
+        scored += await post_single(client, row, latencies)
+    return latencies, scored, len(rows) - scored, time.perf_counter() - start
+
+
+async def run_batch(client, rows, args, endpoint="/api/predict/batch"):
+    latencies = []
+    scored = shed = 0
+    start = time.perf_counter()
+    for i in range(0, len(rows), args.batch_size):
+        chunk = rows[i:i + args.batch_size]
+        request_start = time.perf_counter()
+        response = await client.post(endpoint, json={"records": chunk})
+        elapsed = time.perf_counter() - request_start
+        if accepted(response):
+            latencies.append(elapsed)
+            scored += len(chunk)
+        else:
+            shed += 1
+    return latencies, scored, shed, time.perf_counter() - start
+
+
+def json_rows(rows):
+    # Typed values as a JSON client would send them; the Form path gets strings
+    return [{k: (int(v) if k in ("hypertension", "heart_disease") else v) for k, v in row.items()} for row in rows]
+
+
+async def run_json(client, rows, args):
+    latencies = []
+    start = time.perf_counter()
+    scored = 0
+    for row in json_rows(rows):
+        request_start = time.perf_counter()
+        response = await client.post("/api/predict/json", json=row)
+        elapsed = time.perf_counter() - request_start
+        if accepted(response):
+            latencies.append(elapsed)
+            scored += 1
+    return latencies, scored, len(rows) - scored, time.perf_counter() - start
+
+
+async def run_json_batch(client, rows, args):
+    return await run_batch(client, json_rows(rows), args, endpoint="/api/predict/json/batch")
+
+
+async def run_concurrent(client, rows, args):
+    latencies = []
+    queue = iter(rows)
+
+    async def worker():
+        scored = 0
+        for row in queue:
+            scored += await post_single(client, row, latencies)
+        return scored
+
+    start = time.perf_counter()
+    scored = sum(await asyncio.gather(*(worker() for _ in range(args.concurrency))))
+    return latencies, scored, len(rows) - scored, time.perf_counter() - start
+
+
+MODES = {
+    "single": run_single,
+    "batch": run_batch,
+    "concurrent": run_concurrent,
+    "json": run_json,
+    "json_batch": run_json_batch,
+}
+
+
+async def run_modes(client, rows, args, path):
+    results = []
+    for mode in args.modes:
+        # Warm up connection handling, the pool and any lazy imports
+        await MODES[mode](client, rows[:args.warmup], args)
+        latencies, records, shed, elapsed = await MODES[mode](client, rows, args)
+        results.append(summarize(mode, path, latencies, records, shed, elapsed))
+    return results
+
+
+async def benchmark_in_process(rows, args):
+    service = import_service()
+    if not args.keep_cache:
+        service.prediction_cache.max_size = 0
+    if not args.keep_admission:
+        # --concurrency can exceed the default queue limit on small hosts
+        service.admission.max_in_flight = service.admission.max_queue_depth = 0
+
+    results = []
+    transport = httpx.ASGITransport(app=service.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        model = service.current_model
+        if model.available:
+            results += await run_modes(client, rows, args, f"model:{model.engine.name}")
+        service.current_model = service.LoadedModel(model.path, error="benchmarking fallback path")
+        try:
+            results += await run_modes(client, rows, args, "fallback")
+        finally:
+            service.current_model = model
+    return results
+
+
+async def benchmark_http(rows, args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        return await run_modes(client, rows, args, "server")
+
+
+async def time_per_record(fn, items, records_per_item):
+    start = time.perf_counter()
+    for item in items:
+        await fn(item)
+    return (time.perf_counter() - start) / (len(items) * records_per_item) * 1e6
+
+
+def form_request(body):
+    from starlette.requests import Request
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {"type": "http", "method": "POST", "path": "/api/predict", "query_string": b"",
+             "headers": [(b"content-type", b"application/x-www-form-urlencoded")]}
+    return Request(scope, receive)
+
+
+def benchmark_codec(rows, args):
+    """Microseconds per record to parse requests and serialize responses"""
+    from urllib.parse import urlencode
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    service = import_service()
+    import json_api
+
+    typed = json_rows(rows)
+    form_bodies = [urlencode(row).encode() for row in rows]
+    json_bodies = [json_api.dumps(row) for row in typed]
+    batches = [typed[i:i + args.batch_size] for i in range(0, len(typed), args.batch_size)]
+    batch_bodies = [json.dumps({"records": batch}).encode() for batch in batches]
+    processed = [service.preprocess_input(row) for row in typed]
+    results = [dict(result, execution_time_ms=1.0) for result in service.predict_records(processed)]
+    batch_results = [{"predictions": results[i:i + args.batch_size], "count": args.batch_size,
+                      "execution_time_ms": 1.0} for i in range(0, len(results), args.batch_size)]
+
+    async def parse_form(body):
+        form = await form_request(body).form()
+        service.PatientRecord(**form)
+
+    async def parse_json(body):
+        json_api.parse_record(body)
+
+    async def parse_pydantic_batch(body):
+        service.BatchPredictionRequest(**json.loads(body))
+
+    async def parse_json_batch(body):
+        json_api.parse_batch(body)
+
+    async def serialize_default(result):
+        JSONResponse(jsonable_encoder(result))
+
+    async def serialize_fast(result):
+        json_api.FastJSONResponse(result)
+
+    async def measure():
+        batch_records = len(batches[0]) if batches else 1
+        return [
+            ("parse", "form (multipart + pydantic)", await time_per_record(parse_form, form_bodies, 1)),
+            ("parse", f"json ({json_api.JSON_LIBRARY} + validator)", await time_per_record(parse_json, json_bodies, 1)),
+            ("parse batch", "json + pydantic", await time_per_record(parse_pydantic_batch, batch_bodies, batch_records)),
+            ("parse batch", f"json ({json_api.JSON_LIBRARY} + validator)",
+             await time_per_record(parse_json_batch, batch_bodies, batch_records)),
+            ("serialize", "jsonable_encoder + JSONResponse", await time_per_record(serialize_default, results, 1)),
+            ("serialize", f"FastJSONResponse ({json_api.JSON_LIBRARY})", await time_per_record(serialize_fast, results, 1)),
+            ("serialize batch", "jsonable_encoder + JSONResponse",
+             await time_per_record(serialize_default, batch_results, batch_records)),
+            ("serialize batch", f"FastJSONResponse ({json_api.JSON_LIBRARY})",
+             await time_per_record(serialize_fast, batch_results, batch_records)),
+        ]
+
+    asyncio.run(measure())  # warm up
+    timings = asyncio.run(measure())
+    print(f"{'step':<17}{'implementation':<36}{'us/record':>10}")
+    print("-" * 63)
+    for step, implementation, us in timings:
+        print(f"{step:<17}{implementation:<36}{us:>10.2f}")
+    return [{"step": step, "implementation": implementation, "us_per_record": us}
+            for step, implementation, us in timings]
+
+
+def benchmark_explain(rows, args):
+    """Model call vs model call plus attributions, per batch size"""
+    service = import_service()
+    model = service.current_model
+    if model.explainer is None:
+        sys.exit("The loaded model does not support explanations")
+    records = [service.preprocess_input(row) for row in rows]
+    engine, explainer = model.engine, model.explainer
+
+    def best_of(fn, repeat):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return min(times) * 1000
+
+    results = []
+    for size in (1, 10, 100, 1000):
+        batch = (records * (size // len(records) + 1))[:size]
+        encoded = engine.encode(batch)
+        predict_ms = best_of(lambda: engine.predict_encoded(encoded), 20)
+        explain_ms = best_of(lambda: explainer.predict_and_explain(engine, batch, encoded), 20)
+        results.append({"engine": engine.name, "method": explainer.method, "batch_size": size,
+                        "predict_ms": predict_ms, "predict_explain_ms": explain_ms,
+                        "overhead_ms": explain_ms - predict_ms})
+
+    print(f"{'engine':<10}{'method':<11}{'batch':>7}{'predict ms':>12}{'+explain ms':>13}{'overhead ms':>13}")
+    print("-" * 66)
+    for r in results:
+        print(f"{r['engine']:<10}{r['method']:<11}{r['batch_size']:>7}{r['predict_ms']:>12.3f}"
+              f"{r['predict_explain_ms']:>13.3f}{r['overhead_ms']:>13.3f}")
+    return results
+
+
+def print_table(results):
+    header = (f"{'mode':<12}{'path':<18}{'requests':>9}{'records':>9}{'shed':>7}{'req/s':>10}"
+              f"{'records/s':>11}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['mode']:<12}{r['path']:<18}{r['requests']:>9}{r['records']:>9}{r['shed']:>7}"
+              f"{r['requests_per_s']:>10.1f}{r['records_per_s']:>11.1f}"
+              f"{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay benchmark for the stroke service")
+    parser.add_argument("--url", help="Benchmark a running server instead of the app in-process")
+    parser.add_argument("--data", choices=["train", "test", "both"], default="both")
+    parser.add_argument("--rows", type=int, default=2000, help="Rows replayed per mode (0 = all)")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--keep-cache", action="store_true", help="Leave the prediction cache enabled")
+    parser.add_argument("--keep-admission", action="store_true",
+                        help="Leave admission control enabled in-process (shed requests are counted)")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    parser.add_argument("--codec", action="store_true",
+                        help="Only time request parsing and response serialization, Form vs JSON")
+    parser.add_argument("--explain", action="store_true",
+                        help="Only time the model call with and without attributions")
+    args = parser.parse_args()
+
+    rows = load_rows(args.data, args.rows)
+    if args.codec or args.explain:
+        results = benchmark_codec(rows, args) if args.codec else benchmark_explain(rows, args)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+        return
+
+    print(f"Replaying {len(rows)} rows from {args.data} "
+          f"({'HTTP ' + args.url if args.url else 'in-process'})", file=sys.stderr)
+
+    if args.url:
+        results = asyncio.run(benchmark_http(rows, args))
+    else:
+        results = asyncio.run(benchmark_in_process(rows, args))
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Chunked CSV parsing and scoring for test.csv-shaped files.
+
+Input is consumed incrementally and grouped into fixed-size row chunks,
+so memory stays bounded by the chunk size no matter how large the file
+is. Each scored chunk is rendered in sample_submission.csv format
+(id,stroke). Rows must not contain quoted newlines, which holds for
+test.csv and the population exports.
+
+A row with a value that can't be parsed (say "1.0" for hypertension) is
+written with an empty stroke value rather than failing its chunk, which
+would cut off a response that is already streaming.
+"""
+import codecs
+import csv
+import logging
+
+from starlette.responses import StreamingResponse
+
+from scoring_engines import INPUT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+SUBMISSION_HEADER = "id,stroke\n"
+
+
+class CsvChunker:
+    """Incrementally splits CSV bytes or text into chunks of parsed rows"""
+
+    def __init__(self, chunk_size=5000, encoding="utf-8"):
+        self.chunk_size = max(1, int(chunk_size))
+        self.header = None
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        self._remainder = ""
+        self._rows = []
+        self.rows_read = 0
+
+    def feed(self, data):
+        """Add more input and return any chunks that are now complete"""
+        if isinstance(data, bytes):
+            data = self._decoder.decode(data)
+        text = self._remainder + data
+        lines = text.split("\n")
+        self._remainder = lines.pop()
+        return self._add_lines(lines)
+
+    def finish(self):
+        """Flush the trailing partial line and the last, short chunk"""
+        lines = [self._remainder + self._decoder.decode(b"", final=True)]
+        self._remainder = ""
+        chunks = self._add_lines(lines)
+        if self._rows:
+            chunks.append(self._rows)
+            self._rows = []
+        return chunks
+
+    def _add_lines(self, lines):
+        chunks = []
+        for row in csv.reader(line.rstrip("\r") for line in lines if line.strip()):
+            if self.header is None:
+                self.header = [column.strip() for column in row]
+                continue
+            self._rows.append(row)
+            self.rows_read += 1
+            if len(self._rows) >= self.chunk_size:
+                chunks.append(self._rows)
+                self._rows = []
+        return chunks
+
+
+class RequestStreamingResponse(StreamingResponse):
+    """StreamingResponse that can stream while the request body is still being read.
+
+    The stock class listens for client disconnects on receive(), which would
+    consume the request body messages the response generator is reading.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def rows_to_records(header, rows):
+    """Map CSV rows to raw input dicts, treating empty cells as missing"""
+    positions = {column: i for i, column in enumerate(header)}
+    field_positions = [(field, positions.get(field)) for field in INPUT_FIELDS]
+    id_position = positions.get("id")
+
+    ids, records = [], []
+    for row_number, row in enumerate(rows):
+        record = {}
+        for field, position in field_positions:
+            value = row[position].strip() if position is not None and position < len(row) else ""
+            record[field] = value if value != "" else None
+        ids.append(row[id_position] if id_position is not None else str(row_number))
+        records.append(record)
+    return ids, records
+
+
+def format_submission(ids, probabilities):
+    """Render scored rows as sample_submission.csv lines (no header); None leaves stroke empty"""
+    return "".join(f"{row_id},{'' if p is None else repr(float(p))}\n" for row_id, p in zip(ids, probabilities))
+
+
+def score_rows(header, rows, preprocess_fn, predict_fn):
+    """Parse, score and render one chunk of rows.
+
+    preprocess_fn applies the API defaults to a raw record and predict_fn
+    scores a list of processed records, returning per-record results with
+    a "probability" key. Returns the rendered lines and the number of rows
+    preprocess_fn rejected, which are rendered with an empty stroke value.
+    """
+    ids, records = rows_to_records(header, rows)
+    processed, valid, first_error = [], [], None
+    for row_id, record in zip(ids, records):
+        try:
+            processed.append(preprocess_fn(record))
+        except (TypeError, ValueError) as e:
+            first_error = first_error or f"row {row_id!r}: {e}"
+            valid.append(False)
+        else:
+            valid.append(True)
+    invalid = valid.count(False)
+    if invalid:
+        logger.warning(f"{invalid} of {len(rows)} CSV rows not scored; first was {first_error}",
+                       extra={"invalid": invalid})
+    scores = iter([result["probability"] for result in predict_fn(processed)] if processed else [])
+    probabilities = [next(scores) if ok else None for ok in valid]
+    return format_submission(ids, probabilities), invalid
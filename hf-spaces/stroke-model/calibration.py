@@ -0,0 +1,90 @@
+"""Probability calibration maps stored in the model artifact.
+
+Applying a map is a couple of vectorized NumPy operations, so serving
+needs neither sklearn nor scipy for it. Fitting happens offline in
+tune_thresholds.py.
+"""
+import numpy as np
+
+_EPS = 1e-12
+
+
+def _logit(p):
+    p = np.clip(np.asarray(p, dtype=float), _EPS, 1 - _EPS)
+    return np.log(p) - np.log1p(-p)
+
+
+def _expit(z):
+    return 0.5 * (1.0 + np.tanh(0.5 * z))
+
+
+class Calibrator:
+    """Monotone map from model probability to calibrated probability"""
+
+    def __init__(self, method, params):
+        if method not in ("platt", "isotonic"):
+            raise ValueError(f"Unknown calibration method: {method}")
+        self.method = method
+        self.params = params
+        if method == "isotonic":
+            self.x = np.asarray(params["x"], dtype=float)
+            self.y = np.asarray(params["y"], dtype=float)
+        else:
+            self.a = float(params["a"])
+            self.b = float(params["b"])
+
+    def __call__(self, probabilities):
+        if self.method == "isotonic":
+            # Constant beyond the fitted range, like IsotonicRegression(out_of_bounds='clip')
+            return np.interp(probabilities, self.x, self.y)
+        return _expit(self.a * _logit(probabilities) + self.b)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["method"], data["params"])
+
+    def to_dict(self):
+        return {"method": self.method, "params": self.params}
+
+
+def fit_platt(probabilities, labels, iterations=50, l2=1e-6):
+    """Logistic regression of labels on logit(probability), by Newton's method"""
+    z = _logit(probabilities)
+    y = np.asarray(labels, dtype=float)
+    a, b = 1.0, 0.0
+    for _ in range(iterations):
+        p = _expit(a * z + b)
+        w = p * (1 - p)
+        grad = np.array([((p - y) * z).sum() + l2 * a, (p - y).sum()])
+        hess = np.array([[(w * z * z).sum() + l2, (w * z).sum()], [(w * z).sum(), w.sum() + _EPS]])
+        step = np.linalg.solve(hess, grad)
+        a, b = a - step[0], b - step[1]
+        if np.abs(step).max() < 1e-10:
+            break
+    return Calibrator("platt", {"a": float(a), "b": float(b)})
+
+
+def fit_isotonic(probabilities, labels):
+    # Offline only; the service applies the fitted steps with np.interp
+    from sklearn.isotonic import IsotonicRegression
+    model = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds="clip")
+    model.fit(probabilities, labels)
+    return Calibrator("isotonic", {"x": model.X_thresholds_.tolist(), "y": model.y_thresholds_.tolist()})
+
+
+class CalibratedEngine:
+    """Scoring engine whose probabilities pass through a calibration map"""
+
+    def __init__(self, engine, calibrator):
+        self.base_engine = engine
+        self.calibrator = calibrator
+        self.name = engine.name
+
+    def encode(self, records):
+        return self.base_engine.encode(records)
+
+    def predict_encoded(self, encoded):
+        return self.calibrator(self.base_engine.predict_encoded(encoded))
+
+    def predict_proba(self, records):
+        return self.predict_encoded(self.encode(records))
@@ -0,0 +1,320 @@
+"""Scoring engine that lowers the fitted stroke pipeline into NumPy tables.
+
+The ColumnTransformer is replaced by per-column fill values, scaling
+operations and one-hot lookup tables, and the classifier by its weights
+(linear models) or packed node arrays (tree ensembles). Scoring a batch
+is then a handful of vectorized array operations with no DataFrame, and
+the probability is computed once per record.
+"""
+import numpy as np
+from scipy.special import expit
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import (
+    ExtraTreesClassifier,
+    GradientBoostingClassifier,
+    RandomForestClassifier,
+)
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import MinMaxScaler, OneHotEncoder, RobustScaler, StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+
+from scoring_engines import positive_class_index
+
+
+class UnsupportedModelError(NotImplementedError):
+    pass
+
+
+def _steps(transformer):
+    if isinstance(transformer, Pipeline):
+        return [step for _, step in transformer.steps if step not in (None, 'passthrough')]
+    if transformer == 'passthrough':
+        return []
+    return [transformer]
+
+
+def _column_names(preprocessor, columns):
+    if isinstance(columns, slice) or np.asarray(columns).dtype == bool:
+        return list(np.asarray(preprocessor.feature_names_in_)[columns])
+    return [
+        preprocessor.feature_names_in_[c] if isinstance(c, (int, np.integer)) else c
+        for c in columns
+    ]
+
+
+class _NumericBlock:
+    """Imputation and scaling steps replayed in the same order as sklearn"""
+
+    def __init__(self, columns, steps):
+        self.columns = columns
+        self.fill = None
+        self.ops = []
+        for step in steps:
+            if isinstance(step, SimpleImputer):
+                missing = step.missing_values
+                if step.add_indicator or not (isinstance(missing, float) and np.isnan(missing)):
+                    raise UnsupportedModelError("Only NaN imputation without indicators is supported")
+                self.fill = np.asarray(step.statistics_, dtype=float)
+            elif isinstance(step, StandardScaler):
+                if step.with_mean:
+                    self.ops.append((np.subtract, step.mean_))
+                if step.with_std:
+                    self.ops.append((np.divide, step.scale_))
+            elif isinstance(step, RobustScaler):
+                if step.with_centering:
+                    self.ops.append((np.subtract, step.center_))
+                if step.with_scaling:
+                    self.ops.append((np.divide, step.scale_))
+            elif isinstance(step, MinMaxScaler):
+                if step.clip:
+                    raise UnsupportedModelError("MinMaxScaler(clip=True) is not supported")
+                self.ops.append((np.multiply, step.scale_))
+                self.ops.append((np.add, step.min_))
+            else:
+                raise UnsupportedModelError(f"Unsupported numeric step: {type(step).__name__}")
+        self.width = len(columns)
+        self.sources = list(columns)
+
+    def transform(self, records, out):
+        values = np.array(
+            [[np.nan if r[c] is None else r[c] for c in self.columns] for r in records],
+            dtype=float,
+        ).reshape(len(records), len(self.columns))
+        if self.fill is not None:
+            values = np.where(np.isnan(values), self.fill, values)
+        for op, operand in self.ops:
+            op(values, operand, out=values)
+        out[:] = values
+
+
+class _OneHotBlock:
+    """Per-column category -> output offset tables for a OneHotEncoder"""
+
+    def __init__(self, columns, steps):
+        self.columns = columns
+        self.fill = None
+        encoder = steps[-1]
+        for step in steps[:-1]:
+            if not isinstance(step, SimpleImputer) or step.add_indicator:
+                raise UnsupportedModelError(f"Unsupported categorical step: {type(step).__name__}")
+            self.fill = list(step.statistics_)
+        if not isinstance(encoder, OneHotEncoder):
+            raise UnsupportedModelError(f"Unsupported encoder: {type(encoder).__name__}")
+        if getattr(encoder, '_infrequent_enabled', False):
+            raise UnsupportedModelError("Infrequent category grouping is not supported")
+        self.ignore_unknown = encoder.handle_unknown != 'error'
+
+        drop_idx = getattr(encoder, 'drop_idx_', None)
+        self.tables = []
+        self.sources = []
+        offset = 0
+        for i, categories in enumerate(encoder.categories_):
+            dropped = None if drop_idx is None else drop_idx[i]
+            table = {}
+            for j, category in enumerate(categories.tolist()):
+                if dropped is not None and j == dropped:
+                    table[category] = -1
+                    continue
+                table[category] = offset
+                self.sources.append(columns[i])
+                offset += 1
+            self.tables.append(table)
+        self.width = offset
+
+    def transform(self, records, out):
+        rows = np.arange(len(records))
+        for i, (column, table) in enumerate(zip(self.columns, self.tables)):
+            values = [r[column] for r in records]
+            if self.fill is not None:
+                values = [self.fill[i] if v is None else v for v in values]
+            if self.ignore_unknown:
+                offsets = np.fromiter((table.get(v, -1) for v in values), dtype=np.intp, count=len(values))
+            else:
+                try:
+                    offsets = np.fromiter((table[v] for v in values), dtype=np.intp, count=len(values))
+                except KeyError as e:
+                    raise ValueError(f"Found unknown category {e} in column {column}") from None
+            known = offsets >= 0
+            out[rows[known], offsets[known]] = 1.0
+
+
+class _TreeTables:
+    """All trees of an ensemble packed into flat node arrays.
+
+    Leaves point to themselves and compare against +inf, so every row can
+    walk every tree for max_depth steps without branching on leaf status.
+    """
+
+    ARRAYS = ("left", "right", "feature", "threshold", "value", "roots")
+
+    def __init__(self, trees, node_values):
+        lefts, rights, features, thresholds, values, roots = [], [], [], [], [], []
+        offset = 0
+        for tree, value in zip(trees, node_values):
+            n_nodes = tree.node_count
+            is_leaf = tree.children_left == -1
+            own = np.arange(n_nodes) + offset
+            lefts.append(np.where(is_leaf, own, tree.children_left + offset))
+            rights.append(np.where(is_leaf, own, tree.children_right + offset))
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            values.append(value)
+            roots.append(offset)
+            offset += n_nodes
+        self.left = np.concatenate(lefts).astype(np.intp)
+        self.right = np.concatenate(rights).astype(np.intp)
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds).astype(np.float64)
+        self.value = np.concatenate(values).astype(np.float64)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.max_depth = max(tree.max_depth for tree in trees)
+        self._derive()
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Adopt previously packed arrays as-is, e.g. memory-mapped ones"""
+        tables = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(tables, name, arrays[name])
+        tables.max_depth = int(arrays["max_depth"])
+        tables._derive()
+        return tables
+
+    def _derive(self):
+        # Both children of node i at 2i (right) and 2i + 1 (left), so one step is
+        # a single gather indexed by the comparison result
+        self.children = np.stack([self.right, self.left], axis=1).ravel()
+
+    def arrays(self):
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        arrays["max_depth"] = self.max_depth
+        return arrays
+
+    def leaves(self, X):
+        # Trees compare float32 features against float64 thresholds, as in sklearn
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        flat = X.ravel()
+        offsets = (np.arange(X.shape[0], dtype=np.intp) * X.shape[1])[:, None]
+        nodes = np.tile(self.roots, (X.shape[0], 1))
+        for _ in range(self.max_depth):
+            go_left = flat[offsets + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = self.children[2 * nodes + go_left]
+        return nodes
+
+
+def _class_fraction(tree, positive_idx):
+    value = tree.value[:, 0, :]
+    totals = value.sum(axis=1)
+    totals[totals == 0.0] = 1.0
+    return value[:, positive_idx] / totals
+
+
+class CompiledEngine:
+    """Scores processed records without pandas or the sklearn pipeline"""
+
+    name = "compiled"
+
+    def __init__(self, model_info):
+        pipeline = model_info['model']
+        if not isinstance(pipeline, Pipeline) or len(pipeline.steps) != 2:
+            raise UnsupportedModelError("Expected a (preprocessor, classifier) pipeline")
+        preprocessor = pipeline.steps[0][1]
+        classifier = pipeline.steps[-1][1]
+        if not isinstance(preprocessor, ColumnTransformer):
+            raise UnsupportedModelError(f"Unsupported preprocessor: {type(preprocessor).__name__}")
+
+        self.numeric_cols = list(model_info['numeric_cols'])
+        self.encoded_cols = list(model_info['encoded_cols'])
+        # Packed tree tables stored in the artifact by mmap_artifact.py
+        self._stored_tables = model_info.get('compiled_tables')
+        self.positive_idx = positive_class_index(classifier)
+        self._lower_preprocessor(preprocessor)
+        self._lower_classifier(classifier)
+
+    def _lower_preprocessor(self, preprocessor):
+        self.blocks = []
+        for name, transformer, columns in preprocessor.transformers_:
+            if transformer == 'drop' or len(np.atleast_1d(columns)) == 0:
+                continue
+            columns = _column_names(preprocessor, columns)
+            steps = _steps(transformer)
+            if steps and isinstance(steps[-1], OneHotEncoder):
+                block = _OneHotBlock(columns, steps)
+            else:
+                block = _NumericBlock(columns, steps)
+            output = preprocessor.output_indices_[name]
+            if output.stop - output.start != block.width:
+                raise UnsupportedModelError(f"Output width mismatch for transformer {name}")
+            self.blocks.append((output, block))
+        self.n_features = sum(block.width for _, block in self.blocks)
+        self.feature_sources = [None] * self.n_features
+        for output, block in self.blocks:
+            self.feature_sources[output] = block.sources
+
+    def _pack_trees(self, trees, node_values):
+        stored = self._stored_tables
+        if stored is not None and stored['roots'].shape[0] == len(trees):
+            return _TreeTables.from_arrays(stored)
+        return _TreeTables(trees, node_values)
+
+    def _lower_classifier(self, classifier):
+        self.weights = None
+        self.trees = None
+        if isinstance(classifier, LogisticRegression):
+            if classifier.coef_.shape[0] != 1:
+                raise UnsupportedModelError("Only binary logistic regression is supported")
+            self.weights = classifier.coef_[0].astype(np.float64)
+            self.intercept = float(classifier.intercept_[0])
+            # Explicit multinomial binary models use softmax([-d, d]) == expit(2d)
+            self.logit_scale = 2.0 if getattr(classifier, 'multi_class', 'auto') == 'multinomial' else 1.0
+        elif isinstance(classifier, (RandomForestClassifier, ExtraTreesClassifier)):
+            trees = [estimator.tree_ for estimator in classifier.estimators_]
+            self.trees = self._pack_trees(trees, [_class_fraction(t, self.positive_idx) for t in trees])
+            self.tree_mode = 'mean'
+        elif isinstance(classifier, DecisionTreeClassifier):
+            tree = classifier.tree_
+            self.trees = self._pack_trees([tree], [_class_fraction(tree, self.positive_idx)])
+            self.tree_mode = 'mean'
+        elif isinstance(classifier, GradientBoostingClassifier):
+            if classifier.estimators_.shape[1] != 1:
+                raise UnsupportedModelError("Only binary gradient boosting is supported")
+            trees = [estimator.tree_ for estimator in classifier.estimators_[:, 0]]
+            rate = classifier.learning_rate
+            self.trees = self._pack_trees(trees, [rate * t.value[:, 0, 0] for t in trees])
+            zeros = np.zeros((1, self.n_features), dtype=np.float32)
+            self.init_raw = float(classifier._raw_predict_init(zeros)[0, 0])
+            self.tree_mode = 'boosted'
+        else:
+            raise UnsupportedModelError(f"Unsupported classifier: {type(classifier).__name__}")
+
+    def transform(self, records):
+        """Encode processed records into the classifier's feature matrix"""
+        X = np.zeros((len(records), self.n_features), dtype=np.float64)
+        for output, block in self.blocks:
+            block.transform(records, X[:, output])
+        return X
+
+    encode = transform
+
+    def packed_tables(self):
+        """Arrays worth storing uncompressed in the artifact for memory mapping"""
+        return self.trees.arrays() if self.trees is not None else None
+
+    def predict_encoded(self, X):
+        if self.weights is not None:
+            positive = expit(self.logit_scale * (X @ self.weights + self.intercept))
+            return positive if self.positive_idx == 1 else 1.0 - positive
+        return self.predict_leaves(self.trees.leaves(X))
+
+    def predict_leaves(self, leaves):
+        """Probabilities from the leaf each record reached in every tree"""
+        leaf_values = self.trees.value[leaves]
+        if self.tree_mode == 'mean':
+            return leaf_values.sum(axis=1) / leaf_values.shape[1]
+        positive = expit(self.init_raw + leaf_values.sum(axis=1))
+        return positive if self.positive_idx == 1 else 1.0 - positive
+
+    def predict_proba(self, records):
+        return self.predict_encoded(self.transform(records))
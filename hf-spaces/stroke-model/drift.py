@@ -0,0 +1,199 @@
+"""Streaming drift monitor for request inputs and model probabilities.
+
+Every feature gets a fixed set of bins when the model loads: numeric
+features are cut at deciles of the reference data (train.csv), plus a bin
+for missing values, and categorical features get one bin per reference
+category plus one for anything unseen. The probability is binned at
+deciles of the reference scores. Observing a record increments one counter
+per feature, so memory is fixed and the per-record cost is constant.
+
+Counts accumulate in windows of window_size records. When a window fills,
+its population stability index (PSI) against the reference is computed,
+kept as the latest report, and the counts are folded into the totals
+since load. Conventional PSI readings: below 0.1 stable, 0.1 to 0.25
+moderate shift, above 0.25 significant shift.
+"""
+import bisect
+import time
+
+import numpy as np
+
+from scoring_engines import INPUT_FIELDS
+
+NUMERIC_FEATURES = ("age", "avg_glucose_level", "bmi")
+PROBABILITY = "probability"
+
+DEFAULT_BINS = 10
+# Fewer records than this in a window make PSI too noisy to classify
+MIN_RECORDS = 100
+MODERATE_PSI = 0.1
+SIGNIFICANT_PSI = 0.25
+# Added to every bin count so empty bins don't make PSI infinite
+SMOOTHING = 0.5
+
+
+class NumericSketch:
+    def __init__(self, reference, bins=DEFAULT_BINS):
+        reference = np.asarray(reference, dtype=float)
+        present = reference[~np.isnan(reference)]
+        quantiles = np.linspace(0, 1, bins + 1)[1:-1]
+        self.edges = np.unique(np.quantile(present, quantiles)) if len(present) else np.array([])
+        self._edge_list = self.edges.tolist()
+        # Bins below, between and above the edges, then one for missing values
+        self.size = len(self.edges) + 2
+        bounds = [f"{e:g}" for e in self._edge_list]
+        if bounds:
+            self.labels = [f"< {bounds[0]}"] + [f"{a} to {b}" for a, b in zip(bounds, bounds[1:])] + [f">= {bounds[-1]}"]
+        else:
+            self.labels = ["all"]
+        self.labels.append("missing")
+        self.reference = self.counts(reference)
+
+    def index(self, value):
+        if value is None or value != value:
+            return self.size - 1
+        return bisect.bisect_right(self._edge_list, value)
+
+    def counts(self, values):
+        values = np.asarray(values, dtype=float)
+        index = np.where(np.isnan(values), self.size - 1, np.searchsorted(self.edges, values, side="right"))
+        return np.bincount(index, minlength=self.size)
+
+
+class CategoricalSketch:
+    def __init__(self, reference):
+        values, counts = np.unique(np.asarray([str(v) for v in reference]), return_counts=True)
+        categories = [str(v) for v in values[np.argsort(-counts, kind="stable")]]
+        self.positions = {category: i for i, category in enumerate(categories)}
+        self.size = len(categories) + 1
+        self.labels = categories + ["other"]
+        self.reference = self.counts(reference)
+
+    def index(self, value):
+        return self.positions.get(str(value), self.size - 1)
+
+    def counts(self, values):
+        index = [self.positions.get(str(value), self.size - 1) for value in values]
+        return np.bincount(np.asarray(index, dtype=np.intp), minlength=self.size)
+
+
+def psi(reference_counts, counts):
+    expected = (reference_counts + SMOOTHING) / (reference_counts.sum() + SMOOTHING * len(reference_counts))
+    actual = (counts + SMOOTHING) / (counts.sum() + SMOOTHING * len(counts))
+    terms = (actual - expected) * np.log(actual / expected)
+    return float(terms.sum()), int(np.argmax(terms))
+
+
+def status(score, records):
+    if records < MIN_RECORDS:
+        return "insufficient_data"
+    if score >= SIGNIFICANT_PSI:
+        return "significant"
+    if score >= MODERATE_PSI:
+        return "moderate"
+    return "stable"
+
+
+class DriftMonitor:
+    """Fixed-size sketches of live traffic compared against reference sketches.
+
+    Updated from the event loop only, so it takes no lock.
+    """
+
+    def __init__(self, reference_records, reference_probabilities=None, window_size=1000, bins=DEFAULT_BINS):
+        self.sketches = {}
+        for field in INPUT_FIELDS:
+            values = [record[field] for record in reference_records]
+            if field in NUMERIC_FEATURES:
+                self.sketches[field] = NumericSketch(values, bins)
+            else:
+                self.sketches[field] = CategoricalSketch(values)
+        if reference_probabilities is not None and len(reference_probabilities):
+            self.sketches[PROBABILITY] = NumericSketch(reference_probabilities, bins)
+        self.reference_size = len(reference_records)
+        self.window_size = window_size
+        self.window = {name: np.zeros(sketch.size, dtype=np.int64) for name, sketch in self.sketches.items()}
+        self.total = {name: np.zeros(sketch.size, dtype=np.int64) for name, sketch in self.sketches.items()}
+        self.window_records = 0
+        self.total_records = 0
+        self.window_started = time.time()
+        self.windows_completed = 0
+        self.last_window = None
+
+    def observe(self, records, probabilities=None):
+        """Count processed records and, if given, model probabilities.
+
+        probabilities need not cover every record (fallback scores are left
+        out); each histogram is compared by its own count.
+        """
+        if len(records) == 1:
+            record = records[0]
+            for field in INPUT_FIELDS:
+                self.window[field][self.sketches[field].index(record[field])] += 1
+        else:
+            for field in INPUT_FIELDS:
+                self.window[field] += self.sketches[field].counts([record[field] for record in records])
+        if probabilities is not None and len(probabilities) and PROBABILITY in self.sketches:
+            if len(probabilities) == 1:
+                self.window[PROBABILITY][self.sketches[PROBABILITY].index(float(probabilities[0]))] += 1
+            else:
+                self.window[PROBABILITY] += self.sketches[PROBABILITY].counts(probabilities)
+        self.window_records += len(records)
+        if self.window_records >= self.window_size:
+            self._close_window()
+
+    def _close_window(self):
+        self.last_window = self._report(self.window, self.window_records, self.window_started)
+        for name, counts in self.window.items():
+            self.total[name] += counts
+            counts[:] = 0
+        self.total_records += self.window_records
+        self.window_records = 0
+        self.window_started = time.time()
+        self.windows_completed += 1
+
+    def _report(self, counts, records, started_at=None):
+        features = {}
+        for name, sketch in self.sketches.items():
+            observed = int(counts[name].sum())
+            if not observed:
+                features[name] = {"psi": None, "status": "insufficient_data", "largest_shift": None}
+                continue
+            score, worst = psi(sketch.reference, counts[name])
+            feature_status = status(score, observed)
+            features[name] = {
+                "psi": score,
+                "status": feature_status,
+                # The bin contributing most to PSI, when there is a shift worth explaining
+                "largest_shift": sketch.labels[worst] if feature_status in ("moderate", "significant") else None,
+            }
+        scored = {name: f["psi"] for name, f in features.items() if f["psi"] is not None}
+        report = {
+            "records": records,
+            "max_psi": max(scored.values()) if scored else None,
+            "drifted": sorted(name for name, f in features.items() if f["status"] in ("moderate", "significant")),
+            "features": features,
+        }
+        if started_at is not None:
+            report["started_at"] = started_at
+            report["ended_at"] = time.time()
+        return report
+
+    def report(self):
+        total = {name: self.total[name] + self.window[name] for name in self.sketches}
+        return {
+            "reference_size": self.reference_size,
+            "window_size": self.window_size,
+            "windows_completed": self.windows_completed,
+            "thresholds": {"moderate": MODERATE_PSI, "significant": SIGNIFICANT_PSI, "min_records": MIN_RECORDS},
+            "last_window": self.last_window,
+            "current_window": self._report(self.window, self.window_records),
+            "since_load": self._report(total, self.total_records + self.window_records),
+        }
+
+
+def build_drift_monitor(reference_records, population=None, window_size=1000):
+    """Monitor against the reference records, or None without them"""
+    if not reference_records or window_size <= 0:
+        return None
+    return DriftMonitor(reference_records, population.overall if population is not None else None, window_size)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Export the stroke pipeline in model.joblib to ONNX and compare backends.
+
+Usage:
+    python export_onnx.py --model model.joblib --output model.onnx --data train.csv
+
+Steps:
+  1. Convert model_info['model'] with skl2onnx (numeric inputs as float32,
+     categorical inputs as strings, probabilities as a plain tensor). The
+     inputs and their types come from the fitted ColumnTransformer.
+     Calibration, threshold, risk bands and population tables from
+     tune_thresholds.py/train.py are copied into the ONNX metadata, so
+     re-export after tuning.
+  2. Check parity against the joblib pipeline on every row of --data.
+     Trees see float32 features in ONNX, so a few rows that sit exactly on
+     a split threshold may differ; the check bounds the mean difference
+     and label agreement rather than requiring bit-exact output.
+  3. Report cold-start time (fresh interpreter, import + load) and
+     per-request latency of both backends side by side.
+
+skl2onnx is only needed here; serving needs just onnxruntime.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType, StringTensorType
+
+from onnx_engine import ARTIFACT_METADATA_KEYS, OnnxEngine
+from scoring_engines import INPUT_FIELDS, PROBE_RECORDS, SklearnEngine, pipeline_input_columns, positive_class_index
+
+COLD_START_SNIPPETS = {
+    "sklearn": "import joblib; joblib.load({path!r})",
+    "onnx": "import onnxruntime as ort; ort.InferenceSession({path!r}, providers=['CPUExecutionProvider'])",
+}
+
+
+def convert(model_info):
+    pipeline = model_info['model']
+    numeric_cols, categorical_cols = pipeline_input_columns(pipeline)
+    initial_types = (
+        [(column, FloatTensorType([None, 1])) for column in numeric_cols]
+        + [(column, StringTensorType([None, 1])) for column in categorical_cols]
+    )
+    classifier = pipeline.steps[-1][1]
+    onnx_model = convert_sklearn(
+        pipeline,
+        initial_types=initial_types,
+        options={id(classifier): {'zipmap': False}},
+        target_opset={'': 17, 'ai.onnx.ml': 3},
+    )
+    return onnx_model, positive_class_index(classifier), numeric_cols, categorical_cols
+
+
+def add_metadata(onnx_model, values):
+    for key, value in values.items():
+        entry = onnx_model.metadata_props.add()
+        entry.key = key
+        entry.value = value if isinstance(value, str) else json.dumps(value, default=_to_json)
+
+
+def _to_json(value):
+    # NumPy arrays and scalars in population tables and calibration maps
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Cannot store {type(value).__name__} in ONNX metadata")
+
+
+def cold_start_seconds(backend, path, repeats=3):
+    """Best-of-N time to import the runtime and load the artifact in a fresh process"""
+    code = (
+        "import time; start = time.perf_counter(); "
+        + COLD_START_SNIPPETS[backend].format(path=path)
+        + "; print(time.perf_counter() - start)"
+    )
+    timings = [
+        float(subprocess.check_output([sys.executable, "-c", code], text=True).strip())
+        for _ in range(repeats)
+    ]
+    return min(timings)
+
+
+def request_latency_ms(engine, records):
+    """Per-request latency percentiles when scoring one record at a time"""
+    timings = []
+    for record in records:
+        start = time.perf_counter()
+        engine.predict_proba([record])
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, [50, 95, 99])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the stroke pipeline to ONNX")
+    parser.add_argument("--model", default="model.joblib", help="Input model.joblib")
+    parser.add_argument("--output", default="model.onnx", help="Output ONNX file")
+    parser.add_argument("--data", default="train.csv", help="CSV used for the parity check")
+    parser.add_argument("--latency-rows", type=int, default=500, help="Rows timed one at a time")
+    parser.add_argument("--max-mean-diff", type=float, default=1e-4,
+                        help="Largest allowed mean absolute probability difference")
+    parser.add_argument("--min-label-agreement", type=float, default=0.999,
+                        help="Smallest allowed fraction of matching 0/1 labels")
+    parser.add_argument("--force", action="store_true", help="Write the export even if parity fails")
+    args = parser.parse_args()
+
+    model_info = joblib.load(args.model)
+    onnx_model, positive_idx, numeric_cols, categorical_cols = convert(model_info)
+
+    sklearn_engine = SklearnEngine(model_info)
+    copied = [key for key in ARTIFACT_METADATA_KEYS if model_info.get(key) is not None]
+    add_metadata(onnx_model, {
+        'numeric_cols': numeric_cols,
+        'categorical_cols': categorical_cols,
+        'encoded_cols': list(model_info['encoded_cols']),
+        'version': str(model_info.get('version') or f"{int(os.path.getmtime(args.model))}-{os.path.getsize(args.model)}"),
+        'positive_index': str(positive_idx),
+        'probability_output': 'probabilities',
+        'probe_probabilities': [],
+        'artifact_keys': copied,
+        # JSON even for strings, so OnnxEngine can decode every key the same way
+        **{key: json.dumps(model_info[key], default=_to_json)
+           for key in copied},
+    })
+    print(f"Copied from the artifact: {', '.join(copied) if copied else 'nothing (untuned artifact)'}")
+    with open(args.output, "wb") as f:
+        f.write(onnx_model.SerializeToString())
+
+    # Probe outputs are recorded from onnxruntime itself so the service can
+    # detect a runtime that no longer reproduces this export
+    onnx_engine = OnnxEngine(args.output)
+    for entry in onnx_model.metadata_props:
+        if entry.key == 'probe_probabilities':
+            entry.value = json.dumps(onnx_engine.predict_proba(PROBE_RECORDS).tolist())
+    with open(args.output, "wb") as f:
+        f.write(onnx_model.SerializeToString())
+    onnx_engine = OnnxEngine(args.output)
+
+    # Parity on the full dataset
+    data = pd.read_csv(args.data)
+    records = data[INPUT_FIELDS].to_dict('records')
+    expected = sklearn_engine.predict_proba(records)
+    actual = onnx_engine.predict_proba(records)
+    diff = np.abs(expected - actual)
+    label_agreement = float(np.mean((expected > 0.5) == (actual > 0.5)))
+    print(f"Parity on {len(records)} rows of {args.data}:")
+    print(f"  max abs diff   {diff.max():.3g}")
+    print(f"  mean abs diff  {diff.mean():.3g}")
+    print(f"  p99 abs diff   {np.percentile(diff, 99):.3g}")
+    print(f"  label agreement {label_agreement:.4%}")
+    parity_ok = diff.mean() <= args.max_mean_diff and label_agreement >= args.min_label_agreement
+
+    # Side-by-side latency report
+    sample = records[:args.latency_rows]
+    rows = []
+    for name, engine, path in (("sklearn", sklearn_engine, args.model), ("onnx", onnx_engine, args.output)):
+        cold_start = cold_start_seconds(name, path)
+        p50, p95, p99 = request_latency_ms(engine, sample)
+        start = time.perf_counter()
+        engine.predict_proba(records)
+        batch_seconds = time.perf_counter() - start
+        rows.append((name, cold_start * 1000, p50, p95, p99, len(records) / batch_seconds))
+
+    print()
+    print(f"{'backend':<10}{'cold start ms':>15}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'batch rows/s':>15}")
+    for name, cold_start_ms, p50, p95, p99, throughput in rows:
+        print(f"{name:<10}{cold_start_ms:>15.1f}{p50:>10.3f}{p95:>10.3f}{p99:>10.3f}{throughput:>15.0f}")
+
+    if not parity_ok:
+        print("\nParity check FAILED")
+        if not args.force:
+            os.remove(args.output)
+            sys.exit(1)
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import asyncio
+import contextvars
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+
+from deadlines import DeadlineExceeded, check_deadline, deadline_var
+
+
+def _timed_call(fn, args, enqueued_at, deadline=None):
+    """Run fn in the worker and report when it actually started.
+
+    Uses wall-clock time so the timestamps are comparable across processes.
+    A job whose request deadline passed while it was queued is not run.
+    """
+    check_deadline(deadline)
+    started_at = time.time()
+    result = fn(*args)
+    return started_at, time.time(), result
+
+
+class InferencePool:
+    """Bounded executor that keeps model inference off the event loop.
+
+    All bookkeeping happens on the event loop thread, so no locking is
+    needed. Queue depth is the number of submitted jobs beyond what the
+    workers can run at once; wait time is measured from submission until a
+    worker picks the job up.
+
+    Jobs run under the submitting request's deadline (deadlines.deadline_var).
+    Cancelled jobs that have not started are removed from the queue; those
+    already running finish anyway, and their run time is counted as wasted.
+    """
+
+    def __init__(self, max_workers, kind="thread", window=1024, on_wait=None):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown inference pool kind: {kind}")
+        self.max_workers = max(1, int(max_workers))
+        self.kind = kind
+        self._executor = None
+        self.in_flight = 0
+        self.max_queue_depth = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.expired = 0
+        self.cancelled_queued = 0
+        self.cancelled_running = 0
+        self.wasted_run_ms = 0.0
+        self.total_wait_ms = 0.0
+        self.total_run_ms = 0.0
+        self._recent_wait_ms = deque(maxlen=window)
+        self.on_wait = on_wait
+
+    @property
+    def executor(self):
+        # Created lazily so the pool is never inherited across a fork
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="inference"
+                )
+        return self._executor
+
+    @property
+    def queue_depth(self):
+        return max(0, self.in_flight - self.max_workers)
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        enqueued_at = time.time()
+        self.submitted += 1
+        self.in_flight += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        call = (_timed_call, fn, args, enqueued_at, deadline_var.get())
+        if self.kind == "thread":
+            # Carry the request's context (e.g. its log request ID) into the worker thread
+            call = (contextvars.copy_context().run,) + call
+        job = self.executor.submit(*call)
+        try:
+            started_at, finished_at, result = await asyncio.wrap_future(job, loop=loop)
+        except DeadlineExceeded:
+            self.expired += 1
+            raise
+        except asyncio.CancelledError:
+            if job.cancel():
+                self.cancelled_queued += 1
+            else:
+                self.cancelled_running += 1
+                job.add_done_callback(lambda job: loop.call_soon_threadsafe(self._record_wasted, job))
+            raise
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+        wait_ms = (started_at - enqueued_at) * 1000
+        self.completed += 1
+        self.total_wait_ms += wait_ms
+        self.total_run_ms += (finished_at - started_at) * 1000
+        self._recent_wait_ms.append(wait_ms)
+        if self.on_wait is not None:
+            self.on_wait(wait_ms)
+        return result
+
+    def _record_wasted(self, job):
+        if not job.cancelled() and job.exception() is None:
+            started_at, finished_at, _ = job.result()
+            self.wasted_run_ms += (finished_at - started_at) * 1000
+
+    def stats(self):
+        recent = np.fromiter(self._recent_wait_ms, dtype=float)
+        if len(recent):
+            p50, p95, p99 = np.percentile(recent, [50, 95, 99])
+        else:
+            p50 = p95 = p99 = 0.0
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "expired": self.expired,
+            "cancelled_queued": self.cancelled_queued,
+            "cancelled_running": self.cancelled_running,
+            "wasted_run_ms": self.wasted_run_ms,
+            "avg_wait_ms": self.total_wait_ms / self.completed if self.completed else 0.0,
+            "avg_run_ms": self.total_run_ms / self.completed if self.completed else 0.0,
+            "recent_wait_ms": {"p50": float(p50), "p95": float(p95), "p99": float(p99)},
+        }
+
+    def recycle(self):
+        """Replace the workers; jobs already running finish on the old ones"""
+        old_executor, self._executor = self._executor, None
+        if old_executor is not None:
+            old_executor.shutdown(wait=False)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
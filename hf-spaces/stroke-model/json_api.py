@@ -0,0 +1,206 @@
+"""JSON codec and precompiled request validation for the JSON endpoints.
+
+Request bodies are decoded with orjson when it is installed (falling back
+to the standard library) and checked by validators compiled once at
+import from the schemas below, so a request costs one decode plus a
+type check per field, with no form parsing or pydantic model building.
+"""
+import json
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+
+    JSON_LIBRARY = "orjson"
+
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+except ImportError:
+    JSON_LIBRARY = "json"
+
+    def loads(data):
+        return json.loads(data)
+
+    def dumps(obj):
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+
+RECORD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "gender": {"type": ["string", "null"]},
+        "age": {"type": ["number", "null"]},
+        "hypertension": {"type": ["integer", "null"]},
+        "heart_disease": {"type": ["integer", "null"]},
+        "ever_married": {"type": ["string", "null"]},
+        "work_type": {"type": ["string", "null"]},
+        "Residence_type": {"type": ["string", "null"]},
+        "avg_glucose_level": {"type": ["number", "null"]},
+        "bmi": {"type": ["number", "null"]},
+        "smoking_status": {"type": ["string", "null"]},
+    },
+}
+
+
+class SchemaValidationError(ValueError):
+    """Request body failed validation; errors use FastAPI's 422 detail format"""
+
+    def __init__(self, errors):
+        super().__init__(errors[0]["msg"] if errors else "Invalid request")
+        self.errors = errors
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
+
+
+def _check_string(value):
+    if isinstance(value, str):
+        return value
+    raise TypeError("Input should be a valid string")
+
+
+def _check_number(value):
+    # bool is an int subclass but not a number in JSON
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    raise TypeError("Input should be a valid number")
+
+
+def _check_integer(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    raise TypeError("Input should be a valid integer")
+
+
+_MISSING = object()
+
+_TYPE_CHECKS = {"string": _check_string, "number": _check_number, "integer": _check_integer}
+
+
+def _compile_field(spec):
+    types = spec["type"] if isinstance(spec["type"], list) else [spec["type"]]
+    nullable = "null" in types
+    (check,) = [_TYPE_CHECKS[t] for t in types if t != "null"]
+    if not nullable:
+        return check
+
+    def check_nullable(value):
+        return None if value is None else check(value)
+
+    return check_nullable
+
+
+_FAST_CHECKS = {
+    "string": "{v}.__class__ is str",
+    "number": "{v}.__class__ is float or {v}.__class__ is int",
+    "integer": "{v}.__class__ is int",
+}
+
+
+def _fast_path_source(schema):
+    """Source of a function that validates well-formed objects in one pass.
+
+    Returns None on any problem so the caller can rerun the slower
+    per-field checks to collect error details.
+    """
+    lines = ["def fast_validate(obj):", "    if obj.__class__ is not dict:", "        return None",
+             "    get = obj.get"]
+    values = []
+    for i, (name, spec) in enumerate(schema["properties"].items()):
+        v = f"v{i}"
+        types = spec["type"] if isinstance(spec["type"], list) else [spec["type"]]
+        (kind,) = [t for t in types if t != "null"]
+        lines.append(f"    {v} = get({name!r})")
+        check = _FAST_CHECKS[kind].format(v=v)
+        if "null" in types:
+            lines.append(f"    if {v} is not None and not ({check}):")
+        else:
+            lines.append(f"    if {v} is not None and not ({check}) or {v} is None and {name!r} in obj:")
+        lines.append("        return None")
+        values.append(f"{name!r}: {f'float({v}) if {v} is not None else None' if kind == 'number' else v}")
+    lines.append("    return {" + ", ".join(values) + "}")
+    return "\n".join(lines)
+
+
+def compile_object_validator(schema):
+    """Build a function validating a decoded object against `schema`.
+
+    Supports the subset used here: an object of optional, possibly
+    nullable string/number/integer properties. Unknown keys are ignored,
+    as with the pydantic models. The common case runs through a function
+    generated from the schema; invalid input is re-checked field by field
+    to report every error.
+    """
+    fields = tuple((name, _compile_field(spec)) for name, spec in schema["properties"].items())
+    namespace = {}
+    exec(_fast_path_source(schema), namespace)
+    fast_validate = namespace["fast_validate"]
+
+    def validate_slow(obj, loc):
+        if not isinstance(obj, dict):
+            raise SchemaValidationError([{"loc": loc, "msg": "Input should be an object", "type": "dict_type"}])
+        clean = {}
+        errors = None
+        for name, check in fields:
+            value = obj.get(name, _MISSING)
+            if value is _MISSING:
+                clean[name] = None
+                continue
+            try:
+                clean[name] = check(value)
+            except TypeError as e:
+                errors = errors or []
+                errors.append({"loc": loc + [name], "msg": str(e), "type": "type_error"})
+        if errors:
+            raise SchemaValidationError(errors)
+        return clean
+
+    def validate(obj, loc):
+        clean = fast_validate(obj)
+        return clean if clean is not None else validate_slow(obj, loc)
+
+    return validate
+
+
+validate_record = compile_object_validator(RECORD_SCHEMA)
+
+
+def _decode(body):
+    try:
+        return loads(body)
+    except ValueError as e:
+        raise SchemaValidationError([{"loc": ["body"], "msg": f"Invalid JSON: {e}", "type": "json_invalid"}])
+
+
+def parse_record(body):
+    """Decode and validate a single-record request body"""
+    return validate_record(_decode(body), ["body"])
+
+
+def parse_batch(body):
+    """Decode and validate a {"records": [...]} request body"""
+    data = _decode(body)
+    records = data.get("records") if isinstance(data, dict) else None
+    if not isinstance(records, list):
+        raise SchemaValidationError([{"loc": ["body", "records"], "msg": "Input should be a list of records",
+                                      "type": "list_type"}])
+    parsed = []
+    errors = []
+    for i, record in enumerate(records):
+        try:
+            parsed.append(validate_record(record, ["body", "records", i]))
+        except SchemaValidationError as e:
+            errors.extend(e.errors)
+    if errors:
+        raise SchemaValidationError(errors)
+    return parsed
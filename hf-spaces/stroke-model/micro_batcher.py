@@ -0,0 +1,136 @@
+import asyncio
+import time
+
+from deadlines import DeadlineExceeded, deadline_var
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-record predictions into one batch call.
+
+    The first record to arrive opens a batch; it is flushed when it reaches
+    max_batch_size or when max_wait_ms has passed, whichever comes first.
+    Each flushed batch is scored with one call to score_fn through runner
+    (e.g. InferencePool.run), and every caller's future is resolved with
+    its own result. Callers whose deadline passed while they waited are
+    dropped from the batch, and the batch runs under the latest remaining
+    deadline.
+    """
+
+    def __init__(self, score_fn, runner, max_batch_size=32, max_wait_ms=5.0):
+        self.score_fn = score_fn
+        self.runner = runner
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        # Batch size histogram buckets: 1, 2, 4, ... up to max_batch_size
+        self._bucket_bounds = []
+        bound = 1
+        while bound < self.max_batch_size:
+            self._bucket_bounds.append(bound)
+            bound *= 2
+        self._bucket_bounds.append(self.max_batch_size)
+        self._bucket_counts = [0] * len(self._bucket_bounds)
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.flushed_full = 0
+        self.flushed_timeout = 0
+        self.total_batch_wait_ms = 0.0
+        self.expired = 0
+        self.abandoned = 0
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future, time.perf_counter(), deadline_var.get()))
+        if len(self._pending) >= self.max_batch_size:
+            self.flushed_full += 1
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush_on_timeout)
+        return await future
+
+    def _flush_on_timeout(self):
+        self._timer = None
+        if self._pending:
+            self.flushed_timeout += 1
+            self._flush()
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        # Callers that already went away or ran out of time don't need scoring
+        now = time.time()
+        for _, future, _, deadline in batch:
+            if deadline is not None and deadline < now and not future.done():
+                self.expired += 1
+                future.set_exception(DeadlineExceeded("Deadline passed while waiting for a micro-batch"))
+        batch = [entry for entry in batch if not entry[1].done()]
+        if not batch:
+            return
+        self._record_batch(batch)
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        # Once every caller has been cancelled, nobody needs the batch either
+        futures = [future for _, future, _, _ in batch]
+
+        def cancel_if_abandoned(_):
+            if all(future.cancelled() for future in futures):
+                self.abandoned += 1
+                task.cancel()
+
+        for future in futures:
+            future.add_done_callback(cancel_if_abandoned)
+
+    def _record_batch(self, batch):
+        size = len(batch)
+        now = time.perf_counter()
+        self.batches += 1
+        self.items += size
+        self.largest_batch = max(self.largest_batch, size)
+        self.total_batch_wait_ms += sum(now - queued_at for _, _, queued_at, _ in batch) * 1000
+        for i, bound in enumerate(self._bucket_bounds):
+            if size <= bound:
+                self._bucket_counts[i] += 1
+                break
+
+    async def _run(self, batch):
+        # Runs in its own task, so this only sets the deadline for the batch
+        deadlines = [deadline for _, _, _, deadline in batch]
+        deadline_var.set(None if None in deadlines else max(deadlines))
+        try:
+            results = await self.runner(self.score_fn, [item for item, _, _, _ in batch])
+        except Exception as e:
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "flushed_full": self.flushed_full,
+            "flushed_timeout": self.flushed_timeout,
+            "expired": self.expired,
+            "abandoned": self.abandoned,
+            "avg_batching_wait_ms": self.total_batch_wait_ms / self.items if self.items else 0.0,
+            "batch_size_histogram": {
+                f"le_{bound}": count
+                for bound, count in zip(self._bucket_bounds, self._bucket_counts)
+            },
+        }
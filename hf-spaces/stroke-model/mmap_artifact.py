@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Re-save model.joblib so its arrays can be memory-mapped.
+
+Usage:
+    python mmap_artifact.py model.joblib -o model.mmap.joblib
+    MODEL_MMAP=1 MODEL_PATH=model.mmap.joblib python app.py
+
+joblib can only memory-map arrays of an uncompressed dump, so the artifact
+is written with compress=0. sklearn's tree objects copy their node arrays
+into private memory when unpickled, so when the classifier is a tree
+ensemble the compiled engine's packed node tables are stored as well;
+with SCORING_ENGINE=compiled those tables are served straight from the
+mapping. Replace a served artifact by renaming the new file over it:
+overwriting it in place changes pages that running processes have mapped.
+"""
+import argparse
+import os
+import time
+
+import joblib
+
+from model_loader import resident_mb
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a memory-mappable stroke model artifact")
+    parser.add_argument("model", help="Existing model.joblib")
+    parser.add_argument("-o", "--output", required=True, help="Path of the uncompressed artifact")
+    parser.add_argument("--no-compiled-tables", action="store_true",
+                        help="Do not store the compiled engine's packed tree tables")
+    args = parser.parse_args()
+
+    info = joblib.load(args.model)
+    info.pop('compiled_tables', None)
+    if not args.no_compiled_tables:
+        try:
+            from compiled_engine import CompiledEngine
+            tables = CompiledEngine(info).packed_tables()
+        except Exception as e:
+            print(f"Not storing compiled tables: {e}")
+            tables = None
+        if tables is not None:
+            info['compiled_tables'] = tables
+            n_bytes = sum(v.nbytes for v in tables.values() if hasattr(v, 'nbytes'))
+            print(f"Storing packed tree tables ({n_bytes / 1024:.1f} KB)")
+
+    # Write next to the target and rename, so processes mapping the old file are unaffected
+    tmp_path = f"{args.output}.tmp"
+    joblib.dump(info, tmp_path, compress=0)
+    os.replace(tmp_path, args.output)
+    print(f"Wrote {args.output} ({os.path.getsize(args.output) / 1024:.1f} KB, "
+          f"was {os.path.getsize(args.model) / 1024:.1f} KB)")
+
+    # Compare loading both ways in this process
+    for label, mmap_mode in (("copied", None), ("memory-mapped", 'r')):
+        rss_before = resident_mb()
+        start = time.perf_counter()
+        loaded = joblib.load(args.output, mmap_mode=mmap_mode)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        rss_after = resident_mb()
+        if rss_before is not None and rss_after is not None:
+            print(f"{label:>14}: {elapsed_ms:.1f} ms, resident {rss_after - rss_before:+.1f} MB")
+        else:
+            print(f"{label:>14}: {elapsed_ms:.1f} ms")
+        del loaded
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import logging
+import math
+import os
+import time
+
+import joblib
+
+from attributions import build_explainer
+from calibration import CalibratedEngine, Calibrator
+from drift import build_drift_monitor
+from population import PopulationPercentiles, build_population, load_reference_records
+from scoring_engines import PROBE_RECORDS, load_engine
+
+logger = logging.getLogger(__name__)
+
+
+def resident_mb():
+    """Resident set size of this process in MB, or None if /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def import_pipeline_modules():
+    """Import the sklearn modules the pipeline artifacts unpickle into.
+
+    Done before measuring the artifact's memory, so that figure does not
+    include the libraries (well over 100 MB the first time).
+    """
+    import sklearn.compose
+    import sklearn.ensemble
+    import sklearn.impute
+    import sklearn.linear_model
+    import sklearn.pipeline
+    import sklearn.preprocessing
+    import sklearn.tree
+
+
+def memory_delta(before, after):
+    return after - before if before is not None and after is not None else None
+
+
+def is_compressed(path):
+    """True for joblib artifacts written with compression, which cannot be memory-mapped"""
+    with open(path, "rb") as f:
+        # Uncompressed dumps are plain pickles, which start with the PROTO opcode
+        return f.read(1) != b"\x80"
+
+
+def artifact_version(path):
+    """Identify an artifact file by modification time and size"""
+    return f"{int(os.path.getmtime(path))}-{os.path.getsize(path)}"
+
+
+class LoadedModel:
+    """Everything request handlers need from one model artifact.
+
+    Handlers read the module-level reference once per request, so swapping
+    that reference to a new LoadedModel is atomic: a request sees either
+    the old model or the new one, never a mix of both.
+    """
+
+    def __init__(self, path, info=None, engine=None, version=None, load_time_ms=0.0, error=None,
+                 memory_mapped=False, rss_delta_mb=None, population=None, explainer=None, drift=None,
+                 derived_rss_mb=None):
+        self.path = path
+        self.info = info
+        self.engine = engine
+        self.version = version
+        self.load_time_ms = load_time_ms
+        self.error = error
+        self.memory_mapped = memory_mapped
+        # Resident memory added by the artifact itself, and by the engine,
+        # population tables, explainer and drift sketches built from it
+        self.rss_delta_mb = rss_delta_mb
+        self.derived_rss_mb = derived_rss_mb
+        self.population = population
+        self.explainer = explainer
+        self.drift = drift
+        # Decision threshold and risk bands tuned for this model, if any; app.py
+        # builds its rule engine from them on first use
+        self.tuning = {key: info[key] for key in ("decision_threshold", "risk_bands") if key in info} if info else {}
+        self.rules = None
+        self.loaded_at = time.time()
+        self.pipeline = info.get('model') if info else None
+        self.numeric_cols = list(info['numeric_cols']) if info else []
+        self.encoded_cols = list(info['encoded_cols']) if info else []
+
+    @property
+    def available(self):
+        return self.engine is not None
+
+    def describe(self):
+        return {
+            "engine": self.engine.name if self.engine else None,
+            "version": self.version,
+            "path": self.path,
+            "load_time_ms": self.load_time_ms,
+            "memory_mapped": self.memory_mapped,
+            "rss_delta_mb": self.rss_delta_mb,
+            "derived_rss_mb": self.derived_rss_mb,
+            "population": self.population.describe() if self.population else None,
+            "explanations": self.explainer.method if self.explainer else None,
+            "calibration": self.engine.calibrator.method if isinstance(self.engine, CalibratedEngine) else None,
+            "decision_threshold": self.tuning.get("decision_threshold"),
+            # Present for artifacts written by train.py
+            "trained_at": self.info.get('trained_at') if self.info else None,
+            "metrics": self.info.get('metrics') if self.info else None,
+            "loaded_at": self.loaded_at,
+            "error": self.error,
+        }
+
+
+def load_model(engine_name, model_path, onnx_path, mmap=False, population_data=None, drift_window=0):
+    """Load and verify a model artifact, raising if it cannot be served.
+
+    With mmap=True, NumPy arrays in an uncompressed joblib artifact are
+    memory-mapped read-only instead of copied onto the heap, so their pages
+    come from the page cache and are shared with other processes on the host.
+
+    Population percentiles come from the artifact if it stores them, or
+    else from scoring population_data (a train.csv-shaped file) once here.
+    The same file is the reference for drift monitoring, in windows of
+    drift_window records (0 disables it).
+    """
+    load_start = time.time()
+    rss_start = resident_mb()
+    memory_mapped = False
+
+    if engine_name == "onnx":
+        # Serve the ONNX export without unpickling the sklearn pipeline
+        from onnx_engine import OnnxEngine
+        logger.info(f"Loading ONNX model from {onnx_path}...")
+        rss_before = resident_mb()
+        engine = OnnxEngine(onnx_path)
+        rss_artifact = resident_mb()
+        max_diff = engine.verify()
+        logger.info(f"ONNX model loaded (max probe difference {max_diff:.2e})")
+        if engine.artifact_keys is None:
+            logger.warning("ONNX export predates copying calibration, decision threshold, risk bands and "
+                           "population tables from the artifact; if model.joblib was tuned, re-run export_onnx.py")
+        info = engine.model_info
+        path = onnx_path
+    else:
+        logger.info("Loading model...")
+        logger.info(f"Model path: {model_path}")
+        logger.info(f"Model file exists: {os.path.exists(model_path)}")
+        logger.info(f"Model file size: {os.path.getsize(model_path) / 1024:.2f} KB")
+
+        if mmap and is_compressed(model_path):
+            logger.warning("Model artifact is compressed and cannot be memory-mapped; "
+                  "re-save it with mmap_artifact.py")
+            mmap = False
+        import_pipeline_modules()
+        rss_before = resident_mb()
+        info = joblib.load(model_path, mmap_mode='r' if mmap else None)
+        rss_artifact = resident_mb()
+        memory_mapped = mmap
+        logger.info(f"Model loaded successfully!{' (memory-mapped)' if memory_mapped else ''}")
+
+        # Access model components
+        model = info['model'].named_steps['classifier']
+        logger.info(f"Model details: Type: {type(model)}")
+
+        # Verify model has predict_proba
+        has_predict_proba = hasattr(model, 'predict_proba')
+        logger.info(f"Model has predict_proba method: {'Yes' if has_predict_proba else 'No'}")
+
+        engine = load_engine(engine_name, info)
+        path = model_path
+
+    logger.info(f"Features: {len(info['numeric_cols'])} numeric features, {len(info['encoded_cols'])} encoded features")
+    logger.info(f"Scoring engine: {engine.name}")
+    if info.get('calibration'):
+        # Written by tune_thresholds.py; applied to every probability the engine returns
+        engine = CalibratedEngine(engine, Calibrator.from_dict(info['calibration']))
+        logger.info(f"Calibration: {engine.calibrator.method}")
+    verify_engine(engine)
+    reference_records = None
+    if population_data and os.path.exists(population_data):
+        reference_records = load_reference_records(population_data)
+    population = load_population(info, engine, reference_records, population_data)
+    try:
+        explainer = build_explainer(info, engine, reference_records)
+    except Exception as e:
+        logger.warning(f"Explanations unavailable: {e}")
+        explainer = None
+    else:
+        logger.info(f"Explanations: {explainer.method if explainer else 'unavailable for this artifact'}")
+    drift = build_drift_monitor(reference_records, population, drift_window)
+    if drift is not None:
+        logger.info(f"Drift monitor: {len(drift.sketches)} sketches, windows of {drift_window} records")
+
+    # Identifies the loaded artifact so cached predictions can be invalidated
+    version = info.get('version') or artifact_version(path)
+    load_time_ms = (time.time() - load_start) * 1000
+    rss_after = resident_mb()
+    rss_delta_mb = memory_delta(rss_before, rss_artifact)
+    derived_rss_mb = memory_delta(rss_artifact, rss_after)
+    libraries_rss_mb = memory_delta(rss_start, rss_before)
+    if rss_delta_mb is not None and derived_rss_mb is not None:
+        logger.info(f"Resident memory: {rss_after:.1f} MB; libraries {libraries_rss_mb:+.1f} MB, "
+                    f"artifact {rss_delta_mb:+.1f} MB{' (memory-mapped)' if memory_mapped else ''}, "
+                    f"engine, percentiles, explainer and drift {derived_rss_mb:+.1f} MB",
+                    extra={"rss_mb": rss_after, "libraries_rss_mb": libraries_rss_mb,
+                           "artifact_rss_mb": rss_delta_mb, "derived_rss_mb": derived_rss_mb})
+    logger.info(f"Model {version} ready in {load_time_ms:.1f} ms")
+    return LoadedModel(path, info, engine, version, load_time_ms,
+                       memory_mapped=memory_mapped, rss_delta_mb=rss_delta_mb, population=population,
+                       explainer=explainer, drift=drift, derived_rss_mb=derived_rss_mb)
+
+
+def load_population(info, engine, reference_records, population_data):
+    if info.get('population') is not None:
+        population = PopulationPercentiles.from_dict(info['population'])
+        logger.info(f"Population percentiles from artifact ({len(population.overall)} records)")
+        return population
+    if not reference_records:
+        logger.info("No population data; responses will not include percentiles")
+        return None
+    start_time = time.time()
+    try:
+        population = build_population(engine, reference_records)
+    except Exception as e:
+        logger.warning(f"Could not build population percentiles from {population_data}: {e}")
+        return None
+    logger.info(f"Population percentiles from {population_data}: {len(population.overall)} records, "
+                f"{len(population.strata)} peer groups in {(time.time() - start_time) * 1000:.1f} ms")
+    return population
+
+
+def verify_engine(engine):
+    """Score the probe rows and check the outputs are valid probabilities"""
+    probabilities = engine.predict_proba(PROBE_RECORDS)
+    if len(probabilities) != len(PROBE_RECORDS):
+        raise ValueError("Model returned the wrong number of probe predictions")
+    for probability in probabilities:
+        if not (math.isfinite(probability) and 0.0 <= probability <= 1.0):
+            raise ValueError(f"Model returned an invalid probe probability: {probability}")
@@ -0,0 +1,83 @@
+import json
+
+import numpy as np
+import onnxruntime as ort
+
+from scoring_engines import PROBE_RECORDS
+
+# Artifact entries written by train.py and tune_thresholds.py that the exporter
+# copies into the ONNX metadata as JSON, so tuned exports serve like the artifact
+ARTIFACT_METADATA_KEYS = (
+    'calibration', 'decision_threshold', 'risk_bands', 'population', 'tuning', 'trained_at', 'metrics',
+)
+
+# onnxruntime input element types mapped to the NumPy dtypes fed to them
+_INPUT_DTYPES = {
+    'tensor(float)': np.float32,
+    'tensor(double)': np.float64,
+    'tensor(int64)': np.int64,
+    'tensor(string)': object,
+}
+
+
+class OnnxEngine:
+    """Scores records with an ONNX export of the pipeline on onnxruntime (CPU).
+
+    Needs neither sklearn nor pandas at serving time. Column lists, model
+    version, reference probe outputs and the artifact's tuning (calibration,
+    threshold, bands, population) are read from the ONNX metadata written
+    by export_onnx.py.
+    """
+
+    name = "onnx"
+
+    def __init__(self, path, intra_op_threads=1):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.inputs = [(i.name, _INPUT_DTYPES[i.type]) for i in self.session.get_inputs()]
+        # Raw input columns are the graph's inputs, which the exporter took from
+        # the fitted ColumnTransformer; encoded_cols is kept for reporting only
+        categorical_cols = [name for name, dtype in self.inputs if dtype is object]
+        self.model_info = {
+            'model': None,
+            'numeric_cols': [name for name, dtype in self.inputs if dtype is not object],
+            'categorical_cols': categorical_cols,
+            'encoded_cols': json.loads(metadata.get('encoded_cols', 'null')) or categorical_cols,
+            'version': metadata.get('version'),
+        }
+        # None for exports made before artifact entries were copied
+        self.artifact_keys = json.loads(metadata['artifact_keys']) if 'artifact_keys' in metadata else None
+        for key in ARTIFACT_METADATA_KEYS:
+            if key in metadata:
+                self.model_info[key] = json.loads(metadata[key])
+        self.positive_idx = int(metadata['positive_index'])
+        self.probe_probabilities = json.loads(metadata['probe_probabilities'])
+        self.output_name = metadata.get('probability_output', 'probabilities')
+
+    def encode(self, records):
+        feeds = {}
+        for name, dtype in self.inputs:
+            if dtype is object:
+                values = [str(r[name]) for r in records]
+            else:
+                values = [np.nan if r[name] is None else r[name] for r in records]
+            feeds[name] = np.array(values, dtype=dtype).reshape(-1, 1)
+        return feeds
+
+    def predict_encoded(self, feeds):
+        probabilities = self.session.run([self.output_name], feeds)[0]
+        return probabilities[:, self.positive_idx].astype(np.float64)
+
+    def predict_proba(self, records):
+        return self.predict_encoded(self.encode(records))
+
+    def verify(self, tolerance=1e-6):
+        """Check this runtime reproduces the probe outputs recorded at export"""
+        actual = self.predict_proba(PROBE_RECORDS)
+        max_diff = float(np.max(np.abs(actual - np.asarray(self.probe_probabilities))))
+        if max_diff > tolerance:
+            raise ValueError(f"ONNX probe outputs differ from export by {max_diff:.3g}")
+        return max_diff
@@ -0,0 +1,136 @@
+"""Population percentiles of model probabilities.
+
+The model scores a reference population (train.csv) once, when it is
+loaded, and keeps the sorted probabilities overall and per sex and age
+band. A patient's percentile is then two binary searches per table, with
+ties ranked at their midpoint so that a group of identical scores
+straddles the same percentile.
+"""
+import csv
+
+import numpy as np
+
+from bulk_scoring import rows_to_records
+from scoring_engines import preprocess_input
+
+# Upper edges of the age bands used for peer groups
+AGE_EDGES = np.array([40.0, 55.0, 65.0, 75.0])
+AGE_LABELS = ["<40", "40-54", "55-64", "65-74", "75+"]
+
+# Peer groups smaller than this use the overall distribution instead
+MIN_STRATUM_SIZE = 200
+
+SCORE_CHUNK_SIZE = 5000
+
+
+def _age_bands(ages):
+    return np.searchsorted(AGE_EDGES, ages, side="right")
+
+
+def _midrank_percentiles(sorted_values, probabilities):
+    below = np.searchsorted(sorted_values, probabilities, side="left")
+    at_or_below = np.searchsorted(sorted_values, probabilities, side="right")
+    return 50.0 * (below + at_or_below) / len(sorted_values)
+
+
+class PopulationPercentiles:
+    """Sorted reference probabilities, overall and by (gender, age band)"""
+
+    def __init__(self, overall, strata):
+        self.overall = overall
+        self.strata = strata
+
+    @classmethod
+    def from_scores(cls, probabilities, genders, ages, min_stratum_size=MIN_STRATUM_SIZE):
+        probabilities = np.asarray(probabilities, dtype=float)
+        genders = np.asarray(genders)
+        bands = _age_bands(np.asarray(ages, dtype=float))
+        strata = {}
+        for gender in np.unique(genders):
+            for band in range(len(AGE_LABELS)):
+                mask = (genders == gender) & (bands == band)
+                if mask.sum() >= min_stratum_size:
+                    strata[(str(gender), band)] = np.sort(probabilities[mask])
+        return cls(np.sort(probabilities), strata)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild from to_dict() output, e.g. stored in a model artifact"""
+        strata = {}
+        for key, values in data["strata"].items():
+            gender, band = key.rsplit("|", 1)
+            strata[(gender, AGE_LABELS.index(band))] = np.asarray(values, dtype=float)
+        return cls(np.asarray(data["overall"], dtype=float), strata)
+
+    def to_dict(self):
+        return {
+            "overall": self.overall,
+            "strata": {f"{gender}|{AGE_LABELS[band]}": values for (gender, band), values in self.strata.items()},
+        }
+
+    def lookup_one(self, probability, record):
+        band = int(_age_bands(record["age"]))
+        values = self.strata.get((record["gender"], band))
+        population = float(_midrank_percentiles(self.overall, probability))
+        return {
+            "population_percentile": population,
+            # Falls back to the whole population when the peer group is too small
+            "peer_percentile": float(_midrank_percentiles(values, probability)) if values is not None else population,
+            "peer_group": f"{record['gender']}, {AGE_LABELS[band]}" if values is not None else None,
+        }
+
+    def lookup(self, probabilities, records):
+        """Population and peer-group percentiles for each scored record"""
+        if len(records) == 1:
+            return [self.lookup_one(float(probabilities[0]), records[0])]
+        probabilities = np.asarray(probabilities, dtype=float)
+        population = _midrank_percentiles(self.overall, probabilities)
+        peer = population.copy()
+        groups = [None] * len(records)
+        bands = _age_bands([record["age"] for record in records])
+        keys = [(record["gender"], int(band)) for record, band in zip(records, bands)]
+        for key in set(keys):
+            values = self.strata.get(key)
+            if values is None:
+                continue
+            rows = [i for i, k in enumerate(keys) if k == key]
+            peer[rows] = _midrank_percentiles(values, probabilities[rows])
+            for i in rows:
+                groups[i] = f"{key[0]}, {AGE_LABELS[key[1]]}"
+        return [
+            {
+                "population_percentile": float(p),
+                "peer_percentile": float(q),
+                "peer_group": group,
+            }
+            for p, q, group in zip(population, peer, groups)
+        ]
+
+    def describe(self):
+        return {
+            "size": int(len(self.overall)),
+            "peer_groups": {f"{gender}, {AGE_LABELS[band]}": int(len(values))
+                            for (gender, band), values in sorted(self.strata.items())},
+        }
+
+
+def load_reference_records(csv_path):
+    """Processed records of a train.csv-shaped file"""
+    with open(csv_path, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        _, raw_records = rows_to_records(header, reader)
+    return [preprocess_input(record) for record in raw_records]
+
+
+def build_population(engine, records):
+    """Score every reference record with engine"""
+    probabilities = np.concatenate([
+        np.asarray(engine.predict_proba(records[i:i + SCORE_CHUNK_SIZE]), dtype=float)
+        for i in range(0, len(records), SCORE_CHUNK_SIZE)
+    ])
+    return PopulationPercentiles.from_scores(
+        probabilities,
+        [record["gender"] for record in records],
+        [record["age"] for record in records],
+    )
@@ -0,0 +1,87 @@
+import time
+from collections import OrderedDict
+
+from scoring_engines import INPUT_FIELDS
+
+
+class PredictionCache:
+    """LRU cache with TTL for predictions keyed on canonicalized inputs.
+
+    Keys are built from processed records (defaults already applied) with
+    floats rounded to `precision` decimals, so repeat submissions and
+    cosmetic edits map to the same entry. The cache is bound to a model
+    version and clears itself when a different model is bound. It is only
+    touched from the event loop, so it needs no locking.
+    """
+
+    def __init__(self, max_size=10000, ttl_seconds=3600.0, precision=2):
+        self.max_size = max(0, int(max_size))
+        self.ttl = float(ttl_seconds)
+        self.precision = int(precision)
+        self.model_version = None
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def key(self, processed_data):
+        return tuple(
+            round(value, self.precision) if isinstance(value, float) else value
+            for value in (processed_data[field] for field in INPUT_FIELDS)
+        )
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        stored_at, result = entry
+        if self.ttl > 0 and time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(result)
+
+    def put(self, key, result, model_version=None):
+        # Results computed by a model that has since been replaced are dropped
+        if not self.enabled or model_version != self.model_version:
+            return
+        self._entries[key] = (time.monotonic(), dict(result))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def bind_model(self, model_version):
+        """Drop every entry if predictions came from a different model"""
+        if model_version != self.model_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.model_version = model_version
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "precision": self.precision,
+            "model_version": self.model_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
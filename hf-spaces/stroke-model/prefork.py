@@ -0,0 +1,227 @@
+"""Pre-fork multi-worker serving with a copy-on-write shared model.
+
+The parent process imports app.py (loading the model once), binds the
+listening socket and forks N uvicorn workers that all accept on it.
+Because the model was loaded before the fork, workers share its pages
+copy-on-write instead of each holding a private copy, and none of them
+pays the cold start. gc.freeze() moves everything allocated so far into
+a permanent generation so the collector doesn't write to those objects
+and break the sharing.
+
+The parent restarts workers that die, forwards SIGTERM/SIGINT, and on
+SIGHUP loads the model again, forks a fresh set of workers from the new
+state and then gracefully stops the old ones. The socket stays open the
+whole time, so no connections are refused.
+"""
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+# Worker index of this process, or None in the parent / single-process mode
+WORKER_INDEX = None
+PARENT_PID = None
+
+_MEMORY_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def process_memory(pid):
+    """RSS, PSS and shared/private memory of a process in MB"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            values = {}
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in _MEMORY_FIELDS:
+                    values[key] = int(rest.split()[0]) / 1024
+        return {
+            "rss_mb": values.get("Rss", 0.0),
+            "pss_mb": values.get("Pss", 0.0),
+            "shared_mb": values.get("Shared_Clean", 0.0) + values.get("Shared_Dirty", 0.0),
+            "private_mb": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0),
+        }
+    except FileNotFoundError:
+        # Older kernels: statm gives resident and shared pages only
+        with open(f"/proc/{pid}/statm") as f:
+            _, resident, shared = (int(v) for v in f.read().split()[:3])
+        page_mb = os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+        return {
+            "rss_mb": resident * page_mb,
+            "pss_mb": None,
+            "shared_mb": shared * page_mb,
+            "private_mb": (resident - shared) * page_mb,
+        }
+
+
+def worker_pids(parent_pid):
+    try:
+        with open(f"/proc/{parent_pid}/task/{parent_pid}/children") as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return [os.getpid()]
+
+
+def memory_report():
+    """Memory of this process and, in pre-fork mode, of every sibling worker"""
+    report = {"pid": os.getpid(), "worker": WORKER_INDEX, "memory": process_memory(os.getpid())}
+    if PARENT_PID is not None:
+        workers = {}
+        for pid in worker_pids(PARENT_PID):
+            try:
+                workers[str(pid)] = process_memory(pid)
+            except OSError:
+                continue
+        report["parent"] = {"pid": PARENT_PID, "memory": process_memory(PARENT_PID)}
+        report["workers"] = workers
+    return report
+
+
+def log_memory_report(pids):
+    for pid in [os.getpid()] + list(pids):
+        try:
+            m = process_memory(pid)
+        except OSError:
+            continue
+        logger.info(f"Memory of pid {pid}: rss {m['rss_mb']:.1f} MB, private {m['private_mb']:.1f} MB",
+                    extra={"pid": pid, "parent": pid == os.getpid(), **m})
+
+
+def _bind(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+_PARENT_SIGNALS = (signal.SIGTERM, signal.SIGINT, signal.SIGHUP)
+
+
+def _spawn(app, sock, index, log_level):
+    # Otherwise children inherit and later re-emit the parent's buffered output
+    sys.stdout.flush()
+    sys.stderr.flush()
+    # Until the child has reset its handlers, a signal sent to it would run the
+    # parent's handler there and be lost; hold signals pending across the fork
+    old_mask = signal.pthread_sigmask(signal.SIG_BLOCK, _PARENT_SIGNALS)
+    try:
+        pid = os.fork()
+    except BaseException:
+        signal.pthread_sigmask(signal.SIG_SETMASK, old_mask)
+        raise
+    if pid:
+        signal.pthread_sigmask(signal.SIG_SETMASK, old_mask)
+        return pid
+
+    # Child: serve until uvicorn handles SIGTERM/SIGINT
+    global WORKER_INDEX
+    WORKER_INDEX = index
+    for signum in _PARENT_SIGNALS:
+        signal.signal(signum, signal.SIG_DFL)
+    signal.pthread_sigmask(signal.SIG_SETMASK, old_mask)
+    try:
+        # Logging is already configured (see structured_logging.py); keep uvicorn from replacing it
+        config = uvicorn.Config(app, log_level=log_level, log_config=None, access_log=False)
+        uvicorn.Server(config).run(sockets=[sock])
+    finally:
+        os._exit(0)
+
+
+def serve_prefork(app, host, port, workers, reload_model=None, memory_report_interval=0.0,
+                  log_level="info"):
+    """Serve app from `workers` forked processes sharing one socket.
+
+    reload_model, if given, is called in the parent on SIGHUP and should
+    install a freshly loaded model before new workers are forked.
+    """
+    global PARENT_PID
+    PARENT_PID = os.getpid()
+    sock = _bind(host, port)
+
+    # Keep the collector from touching (and un-sharing) the loaded model
+    gc.collect()
+    gc.freeze()
+
+    children = {}
+    for index in range(workers):
+        children[_spawn(app, sock, index, log_level)] = index
+    logger.info(f"Pre-fork server on {host}:{port}: parent {PARENT_PID}, workers {sorted(children)}")
+
+    state = {"stop": None, "reload": False}
+
+    def on_stop(signum, frame):
+        state["stop"] = signum
+
+    def on_reload(signum, frame):
+        state["reload"] = True
+
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    signal.signal(signal.SIGHUP, on_reload)
+
+    next_report = time.monotonic() + 5.0
+    retiring = set()
+    while state["stop"] is None:
+        time.sleep(0.5)
+
+        # Reap exited workers and replace any that died unexpectedly
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if pid in retiring:
+                retiring.discard(pid)
+                continue
+            index = children.pop(pid, None)
+            # Once stopping, a worker that exits is not replaced
+            if index is not None and state["stop"] is None:
+                logger.warning(f"Worker {index} (pid {pid}) exited; starting a replacement")
+                children[_spawn(app, sock, index, log_level)] = index
+
+        if state["reload"] and state["stop"] is None:
+            state["reload"] = False
+            if reload_model is None:
+                logger.warning("SIGHUP ignored: no reload function configured")
+            else:
+                try:
+                    reload_model()
+                except Exception as e:
+                    logger.error(f"Reload failed, keeping current workers: {e}")
+                else:
+                    gc.collect()
+                    gc.freeze()
+                    old_children, children = children, {}
+                    for index in range(workers):
+                        children[_spawn(app, sock, index, log_level)] = index
+                    for pid in old_children:
+                        retiring.add(pid)
+                        os.kill(pid, signal.SIGTERM)
+                    logger.info(f"Reloaded; new workers {sorted(children)}, retiring {sorted(old_children)}")
+
+        if next_report is not None and time.monotonic() >= next_report:
+            log_memory_report(children)
+            next_report = time.monotonic() + memory_report_interval if memory_report_interval > 0 else None
+
+    logger.info(f"Received signal {state['stop']}; stopping workers")
+    for pid in list(children) + list(retiring):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for _ in list(children) + list(retiring):
+        try:
+            os.wait()
+        except ChildProcessError:
+            break
+    sock.close()
@@ -0,0 +1,166 @@
+"""Declarative rules for risk levels, risk factors and the fallback estimate.
+
+The rules are plain data (JSON-compatible), evaluated by one engine either
+per record or as NumPy masks over a whole batch. Both paths add the same
+increments in the same order, so they agree exactly. A JSON file with the
+same structure can replace the defaults without code changes.
+"""
+import json
+import operator
+
+import numpy as np
+
+DEFAULT_RULES = {
+    # Probability above which stroke_prediction is 1
+    "decision_threshold": 0.5,
+    # Upper bounds of each band; probabilities at or above the last bound get the last label
+    "risk_bands": [
+        {"below": 0.1, "label": "Very Low Risk"},
+        {"below": 0.3, "label": "Low Risk"},
+        {"below": 0.6, "label": "Moderate Risk"},
+        {"label": "High Risk"},
+    ],
+    "risk_factors": [
+        {"field": "hypertension", "op": "==", "value": 1, "label": "Hypertension"},
+        {"field": "heart_disease", "op": "==", "value": 1, "label": "Heart Disease"},
+        {"field": "age", "op": ">", "value": 65, "label": "Advanced Age (65+)"},
+        {"field": "avg_glucose_level", "op": ">", "value": 140, "label": "High Blood Glucose (>140)"},
+        {"field": "bmi", "op": ">", "value": 30, "label": "Obesity (BMI > 30)"},
+        {"field": "smoking_status", "op": "==", "value": "formerly smoked", "label": "Former Smoker"},
+        {"field": "smoking_status", "op": "==", "value": "smokes", "label": "Current Smoker"},
+    ],
+    # Rule-based estimate used when the model is unavailable. Within a group
+    # only the first matching rule applies (an if/elif chain).
+    "fallback": {
+        "base": 0.05,
+        "cap": 0.8,
+        "groups": [
+            [{"field": "hypertension", "op": "==", "value": 1, "add": 0.1}],
+            [{"field": "heart_disease", "op": "==", "value": 1, "add": 0.1}],
+            [
+                {"field": "age", "op": ">", "value": 65, "add": 0.15},
+                {"field": "age", "op": ">", "value": 55, "add": 0.1},
+            ],
+            [
+                {"field": "avg_glucose_level", "op": ">", "value": 180, "add": 0.1},
+                {"field": "avg_glucose_level", "op": ">", "value": 140, "add": 0.05},
+            ],
+            [{"field": "bmi", "op": ">", "value": 30, "add": 0.05}],
+            [
+                {"field": "smoking_status", "op": "==", "value": "smokes", "add": 0.07},
+                {"field": "smoking_status", "op": "==", "value": "formerly smoked", "add": 0.03},
+            ],
+        ],
+    },
+}
+
+# Both the scalar and the NumPy forms of each comparison
+_OPS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+
+class _Condition:
+    def __init__(self, spec):
+        if spec["op"] not in _OPS:
+            raise ValueError(f"Unknown rule operator: {spec['op']}")
+        self.field = spec["field"]
+        self.op = _OPS[spec["op"]]
+        self.value = spec["value"]
+
+    def matches(self, record):
+        return self.op(record[self.field], self.value)
+
+    def mask(self, columns):
+        return self.op(columns[self.field], self.value)
+
+
+class RuleEngine:
+    """Evaluates a rule table for single records or whole batches"""
+
+    def __init__(self, rules=None):
+        rules = rules or DEFAULT_RULES
+        self.rules = rules
+        self.decision_threshold = float(rules["decision_threshold"])
+
+        bands = rules["risk_bands"]
+        self.band_bounds = np.array([band["below"] for band in bands[:-1]], dtype=float)
+        self.band_labels = [band["label"] for band in bands]
+
+        self.factors = [(_Condition(spec), spec["label"]) for spec in rules["risk_factors"]]
+
+        fallback = rules["fallback"]
+        self.base = float(fallback["base"])
+        self.cap = float(fallback["cap"])
+        self.groups = [[(_Condition(spec), float(spec["add"])) for spec in group] for group in fallback["groups"]]
+
+        self.fields = sorted(
+            {condition.field for condition, _ in self.factors}
+            | {condition.field for group in self.groups for condition, _ in group}
+        )
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def with_tuning(self, tuning):
+        """Copy using a model's tuned decision_threshold and risk_bands (see tune_thresholds.py)"""
+        rules = dict(self.rules)
+        rules.update({key: tuning[key] for key in ("decision_threshold", "risk_bands") if key in tuning})
+        return RuleEngine(rules)
+
+    def columns(self, records):
+        """Arrays of the fields the rules reference, one entry per record"""
+        return {field: np.array([record[field] for record in records]) for field in self.fields}
+
+    # Single record
+
+    def risk_level(self, probability):
+        return self.band_labels[int(np.searchsorted(self.band_bounds, probability, side="right"))]
+
+    def risk_factors(self, record):
+        return [label for condition, label in self.factors if condition.matches(record)]
+
+    def fallback_probability(self, record):
+        probability = self.base
+        for group in self.groups:
+            for condition, add in group:
+                if condition.matches(record):
+                    probability += add
+                    break
+        return min(probability, self.cap)
+
+    # Batches
+
+    def risk_levels(self, probabilities):
+        indices = np.searchsorted(self.band_bounds, probabilities, side="right")
+        return [self.band_labels[i] for i in indices]
+
+    def risk_factors_batch(self, records, columns=None):
+        columns = columns if columns is not None else self.columns(records)
+        factors = [[] for _ in records]
+        for condition, label in self.factors:
+            for i in np.flatnonzero(condition.mask(columns)):
+                factors[i].append(label)
+        return factors
+
+    def fallback_probabilities(self, records, columns=None):
+        columns = columns if columns is not None else self.columns(records)
+        probabilities = np.full(len(records), self.base)
+        for group in self.groups:
+            # Later rules in a group only apply where no earlier one matched
+            unmatched = np.ones(len(records), dtype=bool)
+            for condition, add in group:
+                hit = unmatched & condition.mask(columns)
+                probabilities[hit] += add
+                unmatched &= ~hit
+        return np.minimum(probabilities, self.cap)
+
+    def predictions(self, probabilities):
+        return (np.asarray(probabilities) > self.decision_threshold).astype(int)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Score a test.csv-shaped file and write sample_submission.csv format.
+
+Usage:
+    python score_csv.py test.csv -o submission.csv
+    python score_csv.py population.csv --model ./model.joblib --chunk-size 20000 > scores.csv
+
+The input is read in blocks and scored in fixed-size row chunks, so memory
+use does not grow with the file size.
+"""
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+from bulk_scoring import SUBMISSION_HEADER, CsvChunker
+
+READ_BLOCK_SIZE = 1 << 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk stroke risk scoring")
+    parser.add_argument("input", help="CSV file with test.csv columns ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="Output CSV path ('-' for stdout)")
+    parser.add_argument("--model", help="Path to model.joblib (defaults to MODEL_PATH or /app/model.joblib)")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Rows scored per model call")
+    args = parser.parse_args()
+
+    if args.model:
+        os.environ["MODEL_PATH"] = args.model
+
+    # Keep the service's startup logging out of the scores written to stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        import app
+
+    start_time = time.time()
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    target = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    chunker = CsvChunker(chunk_size=args.chunk_size)
+    invalid = 0
+    try:
+        target.write(SUBMISSION_HEADER)
+        while True:
+            block = source.read(READ_BLOCK_SIZE)
+            chunks = chunker.feed(block) if block else chunker.finish()
+            for rows in chunks:
+                with contextlib.redirect_stdout(sys.stderr):
+                    scored, rejected = app.score_csv_chunk(chunker.header, rows)
+                invalid += rejected
+                target.write(scored)
+            if not block:
+                break
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+    elapsed = time.time() - start_time
+    print(f"Scored {chunker.rows_read} rows in {elapsed:.2f} s "
+          f"({chunker.rows_read / elapsed if elapsed else 0:.0f} rows/s)", file=sys.stderr)
+    if invalid:
+        print(f"Rows with unparsable values, left without a score: {invalid}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Raw input columns expected by the fitted pipeline, in request order
+INPUT_FIELDS = [
+    'gender', 'age', 'hypertension', 'heart_disease', 'ever_married',
+    'work_type', 'Residence_type', 'avg_glucose_level', 'bmi', 'smoking_status'
+]
+
+# Representative processed records used to verify a model before serving it
+PROBE_RECORDS = [
+    {'gender': 'Male', 'age': 67.0, 'hypertension': 1, 'heart_disease': 0, 'ever_married': 'Yes',
+     'work_type': 'Private', 'Residence_type': 'Urban', 'avg_glucose_level': 228.69, 'bmi': 36.6,
+     'smoking_status': 'formerly smoked'},
+    {'gender': 'Female', 'age': 45.0, 'hypertension': 0, 'heart_disease': 0, 'ever_married': 'Yes',
+     'work_type': 'Govt_job', 'Residence_type': 'Rural', 'avg_glucose_level': 85.3, 'bmi': 24.1,
+     'smoking_status': 'never smoked'},
+    {'gender': 'Female', 'age': 81.0, 'hypertension': 1, 'heart_disease': 1, 'ever_married': 'Yes',
+     'work_type': 'Self-employed', 'Residence_type': 'Urban', 'avg_glucose_level': 186.2, 'bmi': 29.0,
+     'smoking_status': 'smokes'},
+    {'gender': 'Male', 'age': 8.0, 'hypertension': 0, 'heart_disease': 0, 'ever_married': 'No',
+     'work_type': 'children', 'Residence_type': 'Rural', 'avg_glucose_level': 95.0, 'bmi': 17.5,
+     'smoking_status': 'Unknown'},
+    {'gender': 'Other', 'age': 58.0, 'hypertension': 0, 'heart_disease': 1, 'ever_married': 'No',
+     'work_type': 'Never_worked', 'Residence_type': 'Urban', 'avg_glucose_level': 0, 'bmi': 0,
+     'smoking_status': 'never smoked'},
+]
+
+
+def preprocess_input(data):
+    """Fill default values for missing fields and coerce numeric types"""
+    return {
+        'gender': data.get('gender') or 'Male',
+        'age': float(data['age']) if data.get('age') is not None else 0,
+        'hypertension': int(data['hypertension']) if data.get('hypertension') is not None else 0,
+        'heart_disease': int(data['heart_disease']) if data.get('heart_disease') is not None else 0,
+        'ever_married': data.get('ever_married') or 'No',
+        'work_type': data.get('work_type') or 'Private',
+        'Residence_type': data.get('Residence_type') or 'Urban',
+        'avg_glucose_level': float(data['avg_glucose_level']) if data.get('avg_glucose_level') is not None else 0,
+        'bmi': float(data['bmi']) if data.get('bmi') is not None else 0,
+        'smoking_status': data.get('smoking_status') or 'never smoked'
+    }
+
+
+def positive_class_index(classifier):
+    return list(classifier.classes_).index(1)
+
+
+def pipeline_input_columns(pipeline):
+    """Raw (numeric, categorical) input columns of a fitted (preprocessor, classifier) pipeline.
+
+    Read from the fitted ColumnTransformer rather than the artifact's
+    encoded_cols, which holds the one-hot output names in artifacts written
+    by train.py. Columns whose transformer ends in an encoder are categorical.
+    """
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder
+    preprocessor = pipeline.steps[0][1]
+    numeric, categorical = [], []
+    for _, transformer, columns in preprocessor.transformers_:
+        if transformer == 'drop' or len(np.atleast_1d(columns)) == 0:
+            continue
+        if isinstance(columns, slice) or np.asarray(columns).dtype == bool:
+            columns = np.asarray(preprocessor.feature_names_in_)[columns]
+        names = [preprocessor.feature_names_in_[c] if isinstance(c, (int, np.integer)) else c for c in columns]
+        last = transformer.steps[-1][1] if isinstance(transformer, Pipeline) else transformer
+        (categorical if isinstance(last, (OneHotEncoder, OrdinalEncoder)) else numeric).extend(map(str, names))
+    return numeric, categorical
+
+
+class SklearnEngine:
+    """Scores records through the fitted sklearn pipeline"""
+
+    name = "sklearn"
+
+    def __init__(self, model_info):
+        # Imported here so engines that don't need pandas never load it
+        import pandas as pd
+        self._DataFrame = pd.DataFrame
+        self.pipeline = model_info['model']
+        self.positive_idx = positive_class_index(self.pipeline)
+
+    def encode(self, records):
+        return self._DataFrame(records, columns=INPUT_FIELDS)
+
+    def predict_encoded(self, input_df):
+        return self.pipeline.predict_proba(input_df)[:, self.positive_idx]
+
+    def predict_proba(self, records):
+        return self.predict_encoded(self.encode(records))
+
+
+def check_parity(engine, reference, records=PROBE_RECORDS, tolerance=1e-9):
+    """Return the largest probability difference between two engines"""
+    expected = reference.predict_proba(records)
+    actual = engine.predict_proba(records)
+    max_diff = float(np.max(np.abs(expected - actual)))
+    if max_diff > tolerance:
+        raise ValueError(
+            f"{engine.name} engine differs from {reference.name} by {max_diff:.3g} on probe rows"
+        )
+    return max_diff
+
+
+def load_engine(name, model_info):
+    """Build the requested scoring engine, falling back to sklearn.
+
+    Non-sklearn engines are checked against the sklearn pipeline on the
+    probe rows before they are used.
+    """
+    sklearn_engine = SklearnEngine(model_info)
+    if name == "sklearn":
+        return sklearn_engine
+
+    try:
+        start_time = time.time()
+        if name == "compiled":
+            from compiled_engine import CompiledEngine
+            engine = CompiledEngine(model_info)
+        else:
+            raise ValueError(f"Unknown scoring engine: {name}")
+        max_diff = check_parity(engine, sklearn_engine)
+        logger.info(f"{engine.name} engine ready in {(time.time() - start_time) * 1000:.1f} ms "
+                    f"(max probe difference {max_diff:.2e})")
+        return engine
+    except Exception as e:
+        logger.warning(f"Could not use {name} engine, falling back to sklearn: {e}")
+        return sklearn_engine
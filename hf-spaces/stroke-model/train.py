@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""Retrain the stroke model from train.csv and write a versioned artifact.
+
+Usage:
+    python train.py                              # search, write models/model-<version>.joblib
+    python train.py --install model.joblib       # also replace the served artifact
+    python train.py --quick --jobs 4             # small grid, e.g. to check the pipeline
+
+Runs a cross-validated hyperparameter search over logistic regression,
+random forest and gradient boosting on all cores. The pipeline is built
+with a joblib.Memory cache, so the fitted preprocessing of each fold is
+computed once and reused by every candidate instead of being refit per
+candidate. The artifact is the model_info dict app.py loads (model,
+numeric_cols, encoded_cols) plus a version, training time, metrics and
+population percentile tables, with a JSON copy of the metadata next to
+it. Metrics come from cross-validation and a stratified holdout the
+search never sees.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import joblib
+import pandas as pd
+import sklearn
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import (
+    accuracy_score,
+    average_precision_score,
+    brier_score_loss,
+    f1_score,
+    precision_score,
+    recall_score,
+    roc_auc_score,
+)
+from sklearn.model_selection import GridSearchCV, StratifiedKFold, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from population import build_population, load_reference_records
+from scoring_engines import INPUT_FIELDS, SklearnEngine
+
+TARGET = "stroke"
+# Scaled continuous inputs; everything else is one-hot encoded (see model-card.md)
+NUMERIC_COLS = ['age', 'avg_glucose_level', 'bmi']
+CATEGORICAL_COLS = [field for field in INPUT_FIELDS if field not in NUMERIC_COLS]
+
+PARAM_GRID = [
+    {
+        'classifier': [LogisticRegression(max_iter=2000)],
+        'classifier__C': [0.01, 0.1, 1.0, 10.0],
+        'classifier__class_weight': [None, 'balanced'],
+    },
+    {
+        'classifier': [RandomForestClassifier(random_state=42)],
+        'classifier__n_estimators': [100, 300],
+        'classifier__max_depth': [8, 12, None],
+        'classifier__min_samples_leaf': [1, 5],
+        'classifier__class_weight': [None, 'balanced'],
+    },
+    {
+        'classifier': [GradientBoostingClassifier(random_state=42)],
+        'classifier__n_estimators': [100, 200],
+        'classifier__learning_rate': [0.05, 0.1],
+        'classifier__max_depth': [2, 3],
+    },
+]
+
+QUICK_PARAM_GRID = [
+    {'classifier': [LogisticRegression(max_iter=2000)], 'classifier__C': [0.1, 1.0]},
+    {'classifier': [RandomForestClassifier(random_state=42)], 'classifier__n_estimators': [100],
+     'classifier__max_depth': [8], 'classifier__min_samples_leaf': [1, 5]},
+]
+
+SCORING = {"roc_auc": "roc_auc", "average_precision": "average_precision", "neg_brier": "neg_brier_score"}
+
+
+def build_pipeline(memory=None):
+    preprocessor = ColumnTransformer([
+        ('num', Pipeline([('imputer', SimpleImputer(strategy='median')), ('scaler', StandardScaler())]),
+         NUMERIC_COLS),
+        ('cat', OneHotEncoder(handle_unknown='ignore'), CATEGORICAL_COLS),
+    ])
+    return Pipeline([('preprocessor', preprocessor), ('classifier', LogisticRegression())], memory=memory)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def holdout_metrics(y_true, probabilities):
+    predictions = (probabilities > 0.5).astype(int)
+    return {
+        "roc_auc": roc_auc_score(y_true, probabilities),
+        "average_precision": average_precision_score(y_true, probabilities),
+        "brier": brier_score_loss(y_true, probabilities),
+        "accuracy": accuracy_score(y_true, predictions),
+        "precision": precision_score(y_true, predictions, zero_division=0),
+        "recall": recall_score(y_true, predictions, zero_division=0),
+        "f1": f1_score(y_true, predictions, zero_division=0),
+    }
+
+
+def describe_params(params):
+    # Estimator objects in the grid are reported by class name
+    return {key: (type(value).__name__ if hasattr(value, 'fit') else value) for key, value in params.items()}
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Retrain the stroke model")
+    parser.add_argument("--data", default=os.path.join(here, "train.csv"))
+    parser.add_argument("--output-dir", default=os.path.join(here, "models"))
+    parser.add_argument("--install", help="Also replace this artifact (e.g. model.joblib) with the new model")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fraction held out for final metrics")
+    parser.add_argument("--jobs", type=int, default=-1, help="Parallel fits (-1 = all cores)")
+    parser.add_argument("--cache-dir", help="Keep the preprocessing cache here instead of a temp dir")
+    parser.add_argument("--quick", action="store_true", help="Search a small grid")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    data = pd.read_csv(args.data)
+    X, y = data[INPUT_FIELDS], data[TARGET].astype(int)
+    X_train, X_holdout, y_train, y_holdout = train_test_split(
+        X, y, test_size=args.holdout, stratify=y, random_state=args.seed
+    )
+    print(f"Training on {len(X_train)} rows, holding out {len(X_holdout)} ({y.mean():.1%} positive)")
+
+    cache_dir = args.cache_dir or tempfile.mkdtemp(prefix="stroke-train-cache-")
+    grid = QUICK_PARAM_GRID if args.quick else PARAM_GRID
+    search = GridSearchCV(
+        build_pipeline(joblib.Memory(cache_dir, verbose=0)),
+        grid,
+        scoring=SCORING,
+        refit="roc_auc",
+        cv=StratifiedKFold(n_splits=args.folds, shuffle=True, random_state=args.seed),
+        n_jobs=args.jobs,
+        verbose=1,
+    )
+    search_start = time.time()
+    try:
+        search.fit(X_train, y_train)
+    finally:
+        if not args.cache_dir:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    search_time = time.time() - search_start
+
+    model = search.best_estimator_
+    # The cache only matters while fitting; don't ship its path in the artifact
+    model.set_params(memory=None)
+    best = search.best_index_
+    cv_metrics = {
+        name: {"mean": float(search.cv_results_[f"mean_test_{name}"][best]),
+               "std": float(search.cv_results_[f"std_test_{name}"][best])}
+        for name in SCORING
+    }
+    positive_idx = list(model.classes_).index(1)
+    holdout = holdout_metrics(y_holdout, model.predict_proba(X_holdout)[:, positive_idx])
+    print(f"Best: {describe_params(search.best_params_)}")
+    print(f"CV ROC-AUC {cv_metrics['roc_auc']['mean']:.4f} ± {cv_metrics['roc_auc']['std']:.4f}, "
+          f"holdout ROC-AUC {holdout['roc_auc']:.4f}")
+
+    info = {
+        'model': model,
+        'numeric_cols': NUMERIC_COLS,
+        'encoded_cols': list(model.named_steps['preprocessor'].named_transformers_['cat']
+                             .get_feature_names_out(CATEGORICAL_COLS)),
+        'categorical_cols': CATEGORICAL_COLS,
+    }
+    # Percentile tables over the same processed rows the service would score
+    engine = SklearnEngine(info)
+    info['population'] = build_population(engine, load_reference_records(args.data)).to_dict()
+
+    data_sha = file_sha256(args.data)
+    trained_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    version = f"{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}-{data_sha[:8]}"
+    metadata = {
+        "version": version,
+        "trained_at": trained_at,
+        "training": {
+            "data": {"path": os.path.basename(args.data), "sha256": data_sha, "rows": len(data),
+                     "positive_rate": float(y.mean())},
+            "train_rows": len(X_train),
+            "holdout_rows": len(X_holdout),
+            "folds": args.folds,
+            "candidates": len(search.cv_results_["params"]),
+            "best_params": describe_params(search.best_params_),
+            "search_time_s": search_time,
+            "total_time_s": time.time() - start_time,
+            "jobs": args.jobs,
+            "sklearn_version": sklearn.__version__,
+            "python_version": platform.python_version(),
+        },
+        "metrics": {"cv": cv_metrics, "holdout": holdout},
+    }
+    info.update(metadata)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"model-{version}.joblib")
+    joblib.dump(info, path, compress=3)
+    with open(os.path.join(args.output_dir, f"model-{version}.json"), "w") as f:
+        json.dump(metadata, f, indent=2, default=float)
+    print(f"Wrote {path} ({os.path.getsize(path) / 1024:.1f} KB) in {time.time() - start_time:.1f} s")
+
+    if args.install:
+        # Rename into place so a watching service never reads a partial file
+        tmp_path = f"{args.install}.tmp"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, args.install)
+        print(f"Installed as {args.install}")
+
+
+if __name__ == "__main__":
+    main()
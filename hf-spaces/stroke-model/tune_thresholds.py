@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""Tune the calibration, decision threshold and risk bands of a model artifact.
+
+Usage:
+    python tune_thresholds.py model.joblib                    # tune in place
+    python tune_thresholds.py model.joblib -o tuned.joblib --objective fbeta --beta 2
+    python tune_thresholds.py model.joblib --in-sample --calibration platt
+
+Scores train.csv once: by default with out-of-fold predictions of the
+artifact's pipeline refit per fold, since a forest's in-sample scores are
+far more confident than anything it sees in serving. On those scores it
+
+  - cross-fits Platt scaling and isotonic regression and keeps the map
+    with the lowest Brier score (or none, if neither helps),
+  - evaluates every distinct cut of the calibrated scores as a decision
+    threshold at once, from cumulative sums over the sorted scores, and
+    keeps the best one for --objective,
+  - places the risk band edges at quantiles of the calibrated scores.
+
+The calibrator, threshold and bands are written into the artifact, along
+with population percentile tables recomputed in calibrated probabilities.
+app.py applies them at load time; per request calibration is one
+np.interp (isotonic) or expit (Platt) over the batch.
+"""
+import argparse
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from calibration import fit_isotonic, fit_platt
+from model_loader import is_compressed
+from population import PopulationPercentiles, load_reference_records
+from rules import DEFAULT_RULES, RuleEngine
+from scoring_engines import INPUT_FIELDS, SklearnEngine
+
+TARGET = "stroke"
+CALIBRATORS = {"platt": fit_platt, "isotonic": fit_isotonic}
+_EPS = 1e-15
+
+
+def out_of_fold_scores(pipeline, records, labels, folds, jobs, seed):
+    from sklearn.base import clone
+    from sklearn.model_selection import StratifiedKFold, cross_val_predict
+    positive_idx = list(pipeline.classes_).index(1)
+    scores = cross_val_predict(
+        clone(pipeline),
+        pd.DataFrame(records, columns=INPUT_FIELDS),
+        labels,
+        cv=StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed),
+        method="predict_proba",
+        n_jobs=jobs,
+    )
+    return scores[:, positive_idx]
+
+
+def calibration_metrics(probabilities, labels, bins=10):
+    p = np.clip(probabilities, _EPS, 1 - _EPS)
+    # Expected calibration error over equal-width bins
+    which = np.minimum((probabilities * bins).astype(int), bins - 1)
+    counts = np.bincount(which, minlength=bins)
+    gap = np.abs(np.bincount(which, weights=probabilities - labels, minlength=bins))
+    return {
+        "brier": float(np.mean((probabilities - labels) ** 2)),
+        "log_loss": float(-np.mean(labels * np.log(p) + (1 - labels) * np.log1p(-p))),
+        "ece": float(gap.sum() / counts.sum()),
+    }
+
+
+def cross_fit(method, scores, labels, folds, seed):
+    """Calibrated scores where each fold is mapped by a calibrator fit on the others"""
+    fold_of = np.random.default_rng(seed).permutation(len(scores)) % folds
+    calibrated = np.empty_like(scores)
+    for k in range(folds):
+        held_out = fold_of == k
+        calibrator = CALIBRATORS[method](scores[~held_out], labels[~held_out])
+        calibrated[held_out] = calibrator(scores[held_out])
+    return calibrated
+
+
+def threshold_curve(probabilities, labels):
+    """Confusion counts for every distinct threshold, predicting 1 where probability > threshold"""
+    order = np.argsort(-probabilities, kind="stable")
+    scores, hits = probabilities[order], labels[order]
+    tp = np.cumsum(hits)
+    fp = np.cumsum(1 - hits)
+    # Cutting after position i is only possible where the next score is lower
+    cuts = np.flatnonzero(scores[:-1] > scores[1:])
+    return scores[cuts + 1], tp[cuts], fp[cuts], tp[-1], fp[-1]
+
+
+def choose_threshold(probabilities, labels, objective, beta=1.0, min_recall=0.0, min_precision=0.0):
+    thresholds, tp, fp, positives, negatives = threshold_curve(probabilities, labels)
+    precision = tp / (tp + fp)
+    recall = tp / positives
+    specificity = 1 - fp / negatives
+    if objective == "youden":
+        score = recall + specificity - 1
+    else:
+        b2 = (beta if objective == "fbeta" else 1.0) ** 2
+        score = np.where(tp > 0, (1 + b2) * precision * recall / np.maximum(b2 * precision + recall, _EPS), 0.0)
+    score = np.where((recall >= min_recall) & (precision >= min_precision), score, -np.inf)
+    if not np.isfinite(score).any():
+        raise SystemExit("No threshold meets the recall/precision constraints")
+    best = int(np.argmax(score))
+    return {
+        "threshold": float(thresholds[best]),
+        "objective": float(score[best]),
+        "precision": float(precision[best]),
+        "recall": float(recall[best]),
+        "specificity": float(specificity[best]),
+        "flagged_rate": float((tp[best] + fp[best]) / len(labels)),
+        "thresholds_evaluated": int(len(thresholds)),
+    }
+
+
+def choose_bands(probabilities, labels, quantiles, band_labels):
+    edges = np.unique(np.round(np.quantile(probabilities, quantiles), 6))
+    if len(edges) != len(band_labels) - 1:
+        raise SystemExit(f"Band quantiles {quantiles} collapse to {len(edges)} distinct edges; "
+                         f"{len(band_labels) - 1} are needed for {band_labels}")
+    bands = [{"below": float(edge), "label": label} for edge, label in zip(edges, band_labels)]
+    bands.append({"label": band_labels[-1]})
+    which = np.searchsorted(edges, probabilities, side="right")
+    summary = [
+        {"label": label, "share": float(np.mean(which == i)),
+         "observed_rate": float(labels[which == i].mean()) if np.any(which == i) else None,
+         "mean_probability": float(probabilities[which == i].mean()) if np.any(which == i) else None}
+        for i, label in enumerate(band_labels)
+    ]
+    return bands, summary
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Tune calibration, decision threshold and risk bands")
+    parser.add_argument("model", help="joblib model artifact")
+    parser.add_argument("-o", "--output", help="Where to write the tuned artifact (default: in place)")
+    parser.add_argument("--data", default=os.path.join(here, "train.csv"))
+    parser.add_argument("--rules", help="Rule table whose band labels to use (default: built-in rules)")
+    parser.add_argument("--calibration", choices=["auto", "none", "platt", "isotonic"], default="auto")
+    parser.add_argument("--objective", choices=["f1", "fbeta", "youden"], default="f1")
+    parser.add_argument("--beta", type=float, default=2.0, help="Recall weight for --objective fbeta")
+    parser.add_argument("--min-recall", type=float, default=0.0)
+    parser.add_argument("--min-precision", type=float, default=0.0)
+    parser.add_argument("--band-quantiles", type=float, nargs="+", default=[0.5, 0.8, 0.95],
+                        help="Population quantiles of the band edges, one fewer than there are bands")
+    parser.add_argument("--in-sample", action="store_true",
+                        help="Score with the artifact's model as is instead of refitting it per fold")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--jobs", type=int, default=-1, help="Parallel fold fits (-1 = all cores)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    info = joblib.load(args.model)
+    records = load_reference_records(args.data)
+    labels = pd.read_csv(args.data, usecols=[TARGET])[TARGET].to_numpy(dtype=float)
+    band_labels = (RuleEngine.from_file(args.rules) if args.rules else RuleEngine(DEFAULT_RULES)).band_labels
+    if len(args.band_quantiles) != len(band_labels) - 1:
+        parser.error(f"--band-quantiles needs {len(band_labels) - 1} values for {band_labels}")
+
+    engine = SklearnEngine(info)
+    served_scores = engine.predict_proba(records)
+    if args.in_sample:
+        scores = served_scores
+    else:
+        scores = out_of_fold_scores(info['model'], records, labels, args.folds, args.jobs, args.seed)
+    print(f"Scored {len(records)} rows ({'in-sample' if args.in_sample else f'{args.folds}-fold out-of-fold'}, "
+          f"{labels.mean():.1%} positive) in {time.time() - start_time:.1f} s")
+
+    candidates = {"none": scores}
+    methods = list(CALIBRATORS) if args.calibration == "auto" else [m for m in [args.calibration] if m != "none"]
+    for method in methods:
+        candidates[method] = cross_fit(method, scores, labels, args.folds, args.seed)
+    report = {method: calibration_metrics(calibrated, labels) for method, calibrated in candidates.items()}
+    print(f"{'calibration':<12}{'brier':>10}{'log_loss':>10}{'ece':>10}")
+    for method, metrics in report.items():
+        print(f"{method:<12}{metrics['brier']:>10.5f}{metrics['log_loss']:>10.5f}{metrics['ece']:>10.5f}")
+    chosen = args.calibration if args.calibration != "auto" else min(report, key=lambda m: report[m]["brier"])
+    calibrated = candidates[chosen]
+    calibrator = CALIBRATORS[chosen](scores, labels) if chosen != "none" else None
+    print(f"Calibration: {chosen}")
+
+    threshold = choose_threshold(calibrated, labels, args.objective, args.beta, args.min_recall, args.min_precision)
+    default = choose_threshold(scores, labels, args.objective, args.beta)
+    print(f"Decision threshold {threshold['threshold']:.4f} of {threshold['thresholds_evaluated']} evaluated: "
+          f"precision {threshold['precision']:.3f}, recall {threshold['recall']:.3f}, "
+          f"{threshold['flagged_rate']:.1%} flagged")
+    bands, band_summary = choose_bands(calibrated, labels, args.band_quantiles, band_labels)
+    for band in band_summary:
+        print(f"  {band['label']:<14} {band['share']:>6.1%} of rows, observed rate {band['observed_rate']:.3f}, "
+              f"mean probability {band['mean_probability']:.3f}")
+
+    # Percentiles must be looked up in the same probabilities the service returns
+    served = calibrator(served_scores) if calibrator else served_scores
+    info['population'] = PopulationPercentiles.from_scores(
+        served, [record["gender"] for record in records], [record["age"] for record in records]
+    ).to_dict()
+    if calibrator:
+        info['calibration'] = calibrator.to_dict()
+    else:
+        info.pop('calibration', None)
+    info['decision_threshold'] = threshold['threshold']
+    info['risk_bands'] = bands
+    info['tuning'] = {
+        "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "data": os.path.basename(args.data),
+        "scores": "in_sample" if args.in_sample else f"out_of_fold_{args.folds}",
+        "calibration": {"chosen": chosen, "candidates": report},
+        "threshold": {**threshold, "objective_name": args.objective,
+                      "uncalibrated_best": default["threshold"]},
+        "band_quantiles": args.band_quantiles,
+        "bands": band_summary,
+    }
+
+    output = args.output or args.model
+    # Keep uncompressed artifacts uncompressed so they can still be memory-mapped
+    compress = 3 if is_compressed(args.model) else 0
+    tmp_path = f"{output}.tmp"
+    joblib.dump(info, tmp_path, compress=compress)
+    # Rename into place so a watching service never reads a partial file
+    os.replace(tmp_path, output)
+    print(f"Wrote {output} in {time.time() - start_time:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
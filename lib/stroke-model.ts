@@ -18,6 +18,10 @@ export interface PredictionResult {
   probability: number;
 }
 
+// How long to wait for the model API before falling back. Sent as
+// X-Request-Timeout-Ms so the service can drop work we stopped waiting for.
+const API_TIMEOUT_MS = 10000;
+
 // Risk categories based on probability thresholds
 const RISK_CATEGORIES = {
   'Very Low Risk': 0.1,
@@ -75,8 +79,10 @@ export async function predictStroke(data: StrokeRiskInput): Promise<PredictionRe
       method: "POST",
       headers: {
         "Content-Type": "application/json",
+        "X-Request-Timeout-Ms": String(API_TIMEOUT_MS),
       },
       body: JSON.stringify(apiData),
+      signal: AbortSignal.timeout(API_TIMEOUT_MS),
     });
     
     if (!response.ok) {